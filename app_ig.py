@@ -1,15 +1,15 @@
 import os
 import json
-import requests
-from flask import Flask, jsonify, request
+import base64
+from datetime import datetime
+from flask import Flask, jsonify, request, Response, stream_with_context
 from dotenv import load_dotenv
-from datetime import datetime, timedelta, timezone
-import google.generativeai as genai
-from instagrapi import Client
-from instagrapi.exceptions import LoginRequired
-from database import init_db, post_exists, add_post, save_caption, get_saved_captions, add_user, get_user_by_username, delete_caption
-from rss_handler import fetch_and_store_articles
-from article_handler import process_single_url
+from database import AUTO_MIGRATE, init_db, save_caption, get_saved_captions, get_saved_caption, CAPTIONS_PAGE_SIZE, CAPTIONS_PAGE_MAX, search_content, SEARCH_BRANCHES, SEARCH_PAGE_SIZE, SEARCH_PAGE_MAX, add_user, get_user_by_username, delete_caption, get_pool_metrics, get_latest_news_result, record_news_request, enqueue_ingest_job, get_ingest_job, cancel_ingest_jobs
+from ingest_worker import start_worker_thread
+from article_handler import process_single_url, process_urls, URL_BATCH_MAX
+from stylizer import get_stylization_client
+from response_cache import ResponseCache
+from metrics import registry, span
 from flask_jwt_extended import create_access_token, jwt_required, JWTManager, get_jwt_identity
 from flask_bcrypt import Bcrypt
 
@@ -19,143 +19,56 @@ app = Flask(__name__)
 
 # JWT Configuration
 app.config["JWT_SECRET_KEY"] = os.environ.get("JWT_SECRET_KEY", "super-secret-jwt-key") # Change this in production!
-print(f"DEBUG: JWT_SECRET_KEY loaded: {app.config["JWT_SECRET_KEY"]}") # Debug print
 app.config["JWT_ERROR_MESSAGE_KEY"] = "message" # Return error messages in 'message' field
 jwt = JWTManager(app)
 bcrypt = Bcrypt(app)
 
-# Global flag for halting processes
-HALT_PROCESS = False
-
 # --- Database Initialization ---
-try:
-    init_db()
-    print("✅ Database initialized.")
-except Exception as e:
-    print(f"🔴 ERROR: Could not initialize database: {e}")
-    exit()
-
-# --- Constants ---
-CACHE_FILE = "cache.json"
-CACHE_DURATION_MINUTES = 10
-INSTA_SESSION_FILE = "session.json"
-
-# --- Client Configurations ---
-try:
-    gemini_api_key = os.environ["GEMINI"]
-    genai.configure(api_key=gemini_api_key)
-    gemini_model = genai.GenerativeModel('gemini-2.5-flash')
-    print("✅ Gemini API configured.")
-except KeyError:
-    print("🔴 ERROR: GEMINI_API_KEY not found in .env file.")
-    exit()
-
-# Configure Instagrapi Client
-try:
-    insta_username = os.environ["INSTA_USERNAME"]
-    insta_password = os.environ["INSTA_PASSWORD"]
-    cl = Client()
-
-    if os.path.exists(INSTA_SESSION_FILE):
-        cl.load_settings(INSTA_SESSION_FILE)
-        print("✅ Instagram session loaded from file.")
-        try:
-            cl.get_timeline_feed()
-            print("✅ Instagram session is valid.")
-        except LoginRequired:
-            print("🟠 Instagram session expired. Logging in again.")
-            cl.login(insta_username, insta_password)
-            cl.dump_settings(INSTA_SESSION_FILE)
-    else:
-        print("🟠 No Instagram session file found. Logging in for the first time.")
-        cl.login(insta_username, insta_password)
-        cl.dump_settings(INSTA_SESSION_FILE)
-
-except KeyError as e:
-    print(f"🔴 ERROR: Missing Instagram credential in .env file: {e}")
-    exit()
-except Exception as e:
-    print(f"🔴 ERROR during Instagram login: {e}")
-    exit()
-
-# --- Journalist & Prompt Definitions ---
-INSTA_USERNAMES = ["fabriziorom", "433", "davidornstein", "theathleticfc", "goalglobal", "brfootball", ]
-
-BREAKING_NEWS_PROMPT_TEMPLATE = """
-You are a world-class sports news analyst. Your task is to analyze the provided Instagram post captions and RSS feed articles, then extract the top five most significant, confirmed breaking news stories.
-
-Instructions:
-1.  Read through all the content provided below.
-2.  Identify at least five of the most important and distinct news stories. A story could be a major transfer, a significant match result, or a key injury update.
-3.  For each story you identify, create a JSON object with three keys: "headline", "summary", and "source_caption".
-4.  The "summary" key should contain a neat summary of the news story, with enough context about the subjects of the story to understand its significance.
-5.  The "source_caption" key must contain the full, original caption or article summary from which the story was derived.
-6.  Return your findings as a single, valid JSON array containing these objects.
-7.  If no significant news is found, return an empty JSON array: [].
-
-Example JSON Output:
-[
-  {{
-    "headline": "Player X Signs for Team Y",
-    "summary": "Team Y has officially completed the signing of Player X from Team Z on a five-year contract.",
-    "source_caption": "- @fabriziorom: It’s confirmed! Player X to Team Y, here we go! All documents are signed and the medical is complete. A five-year deal that will be announced by the clubs tomorrow. 🔵 #Transfer"
-  }},
-  {{
-    "headline": "Team A Wins Domestic Cup Final",
-    "summary": "A late goal from their star striker secured the cup for Team A in a dramatic 2-1 victory over their rivals.",
-    "source_caption": "- @The Guardian RSS: Team A Wins Domestic Cup Final\nA late goal from their star striker secured the cup for Team A in a dramatic 2-1 victory over their rivals."
-  }}
-]
-
-Here is the latest content:
----
-{all_content}
----
-"""
-
-# --- Core Logic ---
-def fetch_latest_insta_posts(user_id, time_limit_hours=None):
-    """Fetches the latest post captions from our list of journalists and logs them."""
-    global HALT_PROCESS
-    all_captions = []
-    min_timestamp = None
-    if time_limit_hours:
-        min_timestamp = datetime.now(timezone.utc) - timedelta(hours=int(time_limit_hours))
+# Run by the entry points (below, and gunicorn's on_starting hook), never at import: URL parse workers are
+# spawned processes that re-import the main script, and they must not migrate the schema on their way up.
+# With AUTO_MIGRATE=0 the schema is applied by `python migrate.py` at deploy time, and startup makes no DB calls.
+def migrate_on_startup():
+    if not AUTO_MIGRATE:
+        return
+    try:
+        init_db()
+        print("✅ Database initialized.")
+    except Exception as e:
+        print(f"🔴 ERROR: Could not initialize database: {e}")
+        exit()
+
+# Latest precomputed result per (user_id, time_limit); concurrent misses share one DB read
+news_cache = ResponseCache()
+# Keys whose use this process has recorded recently, so reads write news_requests at most every few minutes
+recorded_requests = ResponseCache(ttl_seconds=300)
+
+def note_news_request(user_id, time_limit):
+    """Records that the user asked for this key, so the ingest worker keeps refreshing it."""
+    def record():
+        record_news_request(user_id, time_limit)
+        return True
+    try:
+        recorded_requests.get((user_id, time_limit), record)
+    except Exception as e:
+        print(f"🟠 Could not record news request: {e}")
+
+def with_requested_timings(payload):
+    """Drops a result's per-stage `timings` block unless the client asked for it with ?timings=1."""
+    if not isinstance(payload, dict) or request.args.get('timings', default=0, type=int) == 1:
+        return payload
+    return {key: value for key, value in payload.items() if key != 'timings'}
 
+def encode_cursor(saved_at, caption_id):
+    """Opaque /api/captions page cursor for the row a page ended on."""
+    return base64.urlsafe_b64encode(f"{saved_at.isoformat()}|{caption_id}".encode()).decode()
+
+def decode_cursor(cursor):
+    """Returns (saved_at, caption_id) from a cursor; raises ValueError for malformed ones."""
     try:
-        for username in INSTA_USERNAMES:
-            if HALT_PROCESS:
-                print("🛑 Instagram fetch halted by user.")
-                return "Process halted."
-            print(f"Fetching posts for @{username}...")
-            insta_user_id = cl.user_id_from_username(username)
-            medias = cl.user_medias(insta_user_id, amount=10) # Fetch more to ensure we get recent ones after filtering
-            for media in medias:
-                if HALT_PROCESS:
-                    print("🛑 Instagram fetch halted by user.")
-                    return "Process halted."
-                
-                if media.taken_at.tzinfo is None:
-                    media.taken_at = media.taken_at.replace(tzinfo=timezone.utc)
-
-                if min_timestamp and media.taken_at < min_timestamp:
-                    print(f"Skipping old Instagram post {media.pk} from @{username}. Timestamp: {media.taken_at}")
-                    continue
-
-                post_id = str(media.pk)
-                if media.caption_text and not post_exists(post_id, user_id):
-                    add_post(post_id, user_id, username, media.caption_text, media.taken_at)
-                    all_captions.append(f"- @{username}: {media.caption_text}\n")
-                elif media.caption_text:
-                    print(f"Skipping post {post_id} from @{username} as it already exists in the database.")
-
-        if not all_captions:
-            return "No new Instagram posts with captions found."
-
-        return "".join(all_captions)
+        saved_at, caption_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(saved_at), int(caption_id)
     except Exception as e:
-        print(f"🔴 ERROR during Instagram fetch: {e}")
-        return f"Error: {e}"
+        raise ValueError(f"Invalid cursor: {cursor}") from e
 
 # --- API Routes ---
 @app.route('/api/register', methods=['POST'])
@@ -201,90 +114,51 @@ def invalid_token_response(callback):
 @app.route('/api/breaking-news', methods=['GET'])
 @jwt_required()
 def get_breaking_news():
-    global HALT_PROCESS
-    HALT_PROCESS = False # Reset halt flag at the start of a new request
-
-    current_user_id = get_jwt_identity()
-
-    inference_url = os.environ.get("KAGGLE_INFERENCE_URL")
-    if not inference_url:
-        return jsonify({"error": "KAGGLE_INFERENCE_URL not set in .env file."}), 500
+    current_user_id = int(get_jwt_identity())
 
     # Get time limit from request arguments
     time_limit_hours = request.args.get('time_limit', type=int)
-
-    if os.path.exists(CACHE_FILE):
-        with open(CACHE_FILE, 'r') as f:
-            cached_data = json.load(f)
-        cached_time = datetime.fromisoformat(cached_data['timestamp'])
-        # Check if cache is still valid AND if time_limit matches
-        if cached_time > datetime.now(timezone.utc) - timedelta(minutes=CACHE_DURATION_MINUTES) and \
-           cached_data.get('time_limit') == time_limit_hours and \
-           cached_data.get('user_id') == current_user_id:
-            print("✅ Serving response from cache.")
-            return jsonify(cached_data)
-
-    print("Cache stale or not found. Fetching new data...")
-
-    # 1. Fetch from all sources, passing the time_limit and user_id
-    insta_captions = fetch_latest_insta_posts(current_user_id, time_limit_hours)
-    if HALT_PROCESS:
-        return jsonify({"message": "Process halted by user."}), 200
-
-    rss_captions = fetch_and_store_articles(current_user_id, time_limit_hours)
-    if HALT_PROCESS:
-        return jsonify({"message": "Process halted by user."}), 200
-    
-    all_content = insta_captions + rss_captions
-
-    if not all_content or ("Error:" in all_content and "No new posts" in all_content):
-        return jsonify({"error": "Failed to fetch new content from any source."}), 500
-
-    # 2. Use Gemini to rank and extract news
-    try:
-        prompt = BREAKING_NEWS_PROMPT_TEMPLATE.format(all_content=all_content)
-        response = gemini_model.generate_content(prompt)
-        
-        clean_response = response.text.strip().replace("```json", "").replace("```", "")
-        ranked_news = json.loads(clean_response)
-
-    except Exception as e:
-        print(f"🔴 ERROR during Gemini analysis: {e}")
-        return jsonify({"error": "Failed to analyze news with Gemini.", "details": str(e)}), 500
-
-    if not ranked_news:
-        return jsonify({"message": "No significant news found to process."}), 200
-
-    # 3. Loop through each news item and call your Kaggle server for stylization
-    for item in ranked_news:
-        if HALT_PROCESS:
-            print("🛑 Stylization halted by user.")
-            return jsonify({"message": "Process halted by user."}), 200
-        try:
-            payload = {"summary": item['summary']}
-            response = requests.post(f"{inference_url}/generate-caption", json=payload, timeout=60)
-            
-            if response.status_code == 200:
-                item['versus_caption'] = response.json().get('stylized_caption', 'Error: Invalid response from server.')
-            else:
-                item['versus_caption'] = f"Error: Server returned status {response.status_code}"
-
-        except requests.exceptions.RequestException as e:
-            print(f"🔴 ERROR connecting to Kaggle server: {e}")
-            item['versus_caption'] = "Error: Could not connect to inference server."
-            
-    # 4. Save the complete package to the cache
-    cache_content = {
-        "timestamp": datetime.now(timezone.utc).isoformat(),
-        "posts": ranked_news,
-        "time_limit": time_limit_hours, # Store time_limit in cache
-        "user_id": current_user_id # Store user_id in cache
-    }
-    with open(CACHE_FILE, 'w') as f:
-        json.dump(cache_content, f, indent=4)
-    
-    print("✅ Full workflow complete. Response cached.")
-    return jsonify(cache_content)
+    force_refresh = request.args.get('refresh', default=0, type=int) == 1
+
+    cache_key = (current_user_id, time_limit_hours)
+    note_news_request(current_user_id, time_limit_hours)
+
+    # Serve the latest result precomputed by the ingest worker
+    if not force_refresh:
+        with span("breaking_news_read"):
+            latest = news_cache.get(cache_key, lambda: get_latest_news_result(current_user_id, time_limit_hours))
+        if latest is not None:
+            result_id, payload, created_at = latest
+            print("✅ Serving precomputed response.")
+            return jsonify({**with_requested_timings(payload), "result_id": result_id})
+
+    # Nothing precomputed yet (or a refresh was forced): queue a pipeline run to poll.
+    # Requests for a key that already has a run in progress get that run's job id.
+    job_id = enqueue_ingest_job(current_user_id, time_limit_hours)
+    print(f"Queued ingest job {job_id}.")
+    return jsonify({"job_id": job_id, "status": "pending"}), 202
+
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+@jwt_required()
+def get_job_endpoint(job_id):
+    current_user_id = int(get_jwt_identity())
+    job = get_ingest_job(job_id, current_user_id)
+    if job is None:
+        return jsonify({"error": "Job not found."}), 404
+    if job['status'] == 'done':
+        # A new result exists for this key; don't keep serving the previous one from memory
+        news_cache.invalidate((current_user_id, job['time_limit']))
+    job['result'] = with_requested_timings(job['result'])
+    return jsonify(job)
+
+@app.route('/api/jobs/<int:job_id>/cancel', methods=['POST'])
+@jwt_required()
+def cancel_job_endpoint(job_id):
+    current_user_id = int(get_jwt_identity())
+    if not cancel_ingest_jobs(current_user_id, job_id):
+        return jsonify({"error": "No active job with that id."}), 404
+    print(f"🛑 Cancel requested for ingest job {job_id}.")
+    return jsonify({"message": "Cancel requested. The job will stop shortly.", "job_ids": [job_id]}), 202
 
 @app.route('/api/process-url', methods=['POST'])
 @jwt_required()
@@ -295,13 +169,59 @@ def process_url_endpoint():
     if not url:
         return jsonify({"error": "URL is required."}), 400
 
-    result = process_single_url(url, current_user_id)
+    result = with_requested_timings(process_single_url(url, current_user_id))
 
     if "error" in result:
         return jsonify(result), 500
     
     return jsonify(result)
 
+@app.route('/api/process-urls', methods=['POST'])
+@jwt_required()
+def process_urls_endpoint():
+    current_user_id = get_jwt_identity()
+    data = request.get_json(silent=True) or {}
+    urls = data.get('urls', None)
+    if not isinstance(urls, list) or not urls or not all(isinstance(url, str) and url.strip() for url in urls):
+        return jsonify({"error": "A non-empty list of URLs is required."}), 400
+    if len(urls) > URL_BATCH_MAX:
+        return jsonify({"error": f"At most {URL_BATCH_MAX} URLs can be processed at once."}), 400
+    urls = [url.strip() for url in urls]
+    invalid = [url for url in urls if not url.lower().startswith(("http://", "https://"))]
+    if invalid:
+        return jsonify({"error": "Every URL must start with http:// or https://.", "invalid": invalid}), 400
+
+    # One JSON object per line, sent as each URL finishes
+    def lines():
+        for result in process_urls(urls, current_user_id):
+            yield json.dumps(with_requested_timings(result)) + "\n"
+
+    return Response(
+        stream_with_context(lines()),
+        mimetype="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route('/api/stylize-stream', methods=['POST'])
+@jwt_required()
+def stylize_stream_endpoint():
+    data = request.get_json()
+    summary = data.get('summary', None) if data else None
+    if not summary:
+        return jsonify({"error": "Summary is required."}), 400
+
+    inference_url = os.environ.get("KAGGLE_INFERENCE_URL")
+    if not inference_url:
+        return jsonify({"error": "KAGGLE_INFERENCE_URL not set in .env file."}), 500
+
+    # Relay the inference server's token stream to the browser as it arrives
+    stream = get_stylization_client(inference_url).stream(summary)
+    return Response(
+        stream_with_context(stream),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.route('/api/captions', methods=['POST'])
 @jwt_required()
 def save_caption_endpoint():
@@ -325,16 +245,37 @@ def save_caption_endpoint():
 @app.route('/api/captions', methods=['GET'])
 @jwt_required()
 def get_captions_endpoint():
+    # One page of the list view: summaries are cut to a preview, source text is left out
     current_user_id = get_jwt_identity()
+    limit = max(1, min(request.args.get('limit', default=CAPTIONS_PAGE_SIZE, type=int), CAPTIONS_PAGE_MAX))
+    cursor = request.args.get('cursor')
     try:
-        captions = get_saved_captions(current_user_id)
+        before = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        rows, has_more = get_saved_captions(current_user_id, limit, before)
         # Convert list of tuples to list of dicts for easier JSON serialization
-        columns = ['id', 'headline', 'summary', 'source_caption', 'versus_caption', 'saved_at']
-        result = [dict(zip(columns, row)) for row in captions]
-        return jsonify(result)
+        columns = ['id', 'headline', 'summary', 'summary_truncated', 'versus_caption', 'saved_at']
+        captions = [dict(zip(columns, row)) for row in rows]
+        next_cursor = encode_cursor(rows[-1][5], rows[-1][0]) if has_more else None
+        return jsonify({"captions": captions, "next_cursor": next_cursor})
     except Exception as e:
         return jsonify({"error": f"Failed to retrieve captions: {e}"}), 500
 
+@app.route('/api/captions/<int:caption_id>', methods=['GET'])
+@jwt_required()
+def get_caption_endpoint(caption_id):
+    current_user_id = get_jwt_identity()
+    try:
+        caption = get_saved_caption(caption_id, current_user_id)
+    except Exception as e:
+        return jsonify({"error": f"Failed to retrieve caption: {e}"}), 500
+    if caption is None:
+        return jsonify({"error": "Caption not found."}), 404
+    columns = ['id', 'headline', 'summary', 'source_caption', 'versus_caption', 'saved_at']
+    return jsonify(dict(zip(columns, caption)))
+
 @app.route('/api/captions/<int:caption_id>', methods=['DELETE'])
 @jwt_required()
 def delete_caption_endpoint(caption_id):
@@ -345,14 +286,73 @@ def delete_caption_endpoint(caption_id):
     except Exception as e:
         return jsonify({"error": f"Failed to delete caption: {e}"}), 500
 
+@app.route('/api/search', methods=['GET'])
+@jwt_required()
+def search_endpoint():
+    # Ranked full-text search over the caller's saved captions and the shared articles and posts
+    current_user_id = get_jwt_identity()
+    text = request.args.get('q', '').strip()
+    if not text or len(text) > 200:
+        return jsonify({"error": "A search query of at most 200 characters is required."}), 400
+    types = [item_type for item_type in request.args.get('types', ','.join(SEARCH_BRANCHES)).split(',') if item_type]
+    unknown = [item_type for item_type in types if item_type not in SEARCH_BRANCHES]
+    if not types or unknown:
+        return jsonify({"error": f"types must be a comma-separated subset of: {', '.join(SEARCH_BRANCHES)}."}), 400
+    limit = max(1, min(request.args.get('limit', default=SEARCH_PAGE_SIZE, type=int), SEARCH_PAGE_MAX))
+    offset = max(0, request.args.get('offset', default=0, type=int))
+    try:
+        with span("search"):
+            rows, has_more = search_content(current_user_id, text, types, limit, offset)
+    except Exception as e:
+        return jsonify({"error": f"Search failed: {e}"}), 500
+    columns = ['type', 'id', 'title', 'snippet', 'date', 'rank']
+    return jsonify({
+        "results": [dict(zip(columns, row)) for row in rows],
+        "next_offset": offset + limit if has_more else None,
+    })
+
 @app.route('/api/halt-loop', methods=['POST'])
 @jwt_required()
 def halt_loop():
-    global HALT_PROCESS
-    HALT_PROCESS = True
-    print("🛑 Halt signal received. Process will terminate soon.")
-    return jsonify({"message": "Halt signal received. Process will terminate soon."}), 200
+    # Halts only the caller's jobs: the one given, or all of their active ones
+    current_user_id = int(get_jwt_identity())
+    job_id = (request.get_json(silent=True) or {}).get('job_id')
+    if job_id is not None:
+        # Job ids are Postgres SERIALs; accept them as JSON numbers or numeric strings
+        if isinstance(job_id, bool) or not str(job_id).isdecimal() or not 0 < int(job_id) < 2**31:
+            return jsonify({"error": "job_id must be a positive integer."}), 400
+        job_id = int(job_id)
+    job_ids = cancel_ingest_jobs(current_user_id, job_id)
+    if not job_ids:
+        return jsonify({"message": "No running process to halt.", "job_ids": []}), 200
+    print(f"🛑 Halt signal received for jobs {job_ids}. Process will terminate soon.")
+    return jsonify({"message": "Halt signal received. Process will terminate soon.", "job_ids": job_ids}), 200
+
+@app.route('/api/health', methods=['GET'])
+def health():
+    return jsonify({"status": "ok", "db_pool": get_pool_metrics(), "response_cache": news_cache.stats()}), 200
+
+def sample_gauges():
+    # Pool and cache stats are sampled at scrape (and snapshot) time; counters and stage timings accumulate in the registry.
+    # A worker that hasn't served a DB request yet has no pool to report, and sampling must not open one.
+    for name, value in get_pool_metrics(open_only=True).items():
+        if isinstance(value, (int, float)):
+            registry.set_gauge(f"db_pool_{name}", value)
+    for name, value in news_cache.stats().items():
+        registry.set_gauge(f"response_cache_{name}", value)
+
+registry.add_collector(sample_gauges)
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    # Under gunicorn (METRICS_MULTIPROC_DIR) this covers every worker, whichever one answers the scrape
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
 
 # --- Main execution ---
 if __name__ == '__main__':
+    migrate_on_startup()
+    # Run the ingest worker in-process unless it is deployed separately (python ingest_worker.py).
+    # Under the debug reloader only the serving child process starts it.
+    if os.environ.get("INGEST_WORKER_IN_PROCESS", "1") == "1" and os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_worker_thread()
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,86 @@
+import os
+import hashlib
+import threading
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from database import get_article_cache_entries, set_article_cache_entry, touch_article_cache_entry, evict_article_cache
+
+# --- Article Cache Configuration ---
+ARTICLE_CACHE_ENABLED = os.environ.get("ARTICLE_CACHE_ENABLED", "1") == "1"
+ARTICLE_CACHE_FRESH_MINUTES = int(os.environ.get("ARTICLE_CACHE_FRESH_MINUTES", 60)) # Served without contacting the site for this long, then revalidated
+ARTICLE_CACHE_MAX_ENTRIES = int(os.environ.get("ARTICLE_CACHE_MAX_ENTRIES", 2000)) # Least recently used articles beyond this are evicted
+ARTICLE_CACHE_EVICT_EVERY = 50 # Writes between eviction passes
+
+TRACKING_PARAMS = {"fbclid", "gclid", "igshid", "mc_cid", "mc_eid", "ref", "ref_src"}
+
+_writes_since_eviction = 0
+_writes_lock = threading.Lock()
+
+def normalize_url(url):
+    """
+    Canonical form of an article URL: lowercase scheme and host, no default port,
+    fragment or tracking parameters (utm_*, fbclid, ...), and sorted query parameters.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and (scheme, parts.port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{parts.port}"
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith("utm_") and key.lower() not in TRACKING_PARAMS
+    ))
+    return urlunsplit((scheme, host, parts.path or "/", query, ""))
+
+def _cache_key(url):
+    return hashlib.sha256(normalize_url(url).encode("utf-8")).hexdigest()
+
+def lookup_articles(urls):
+    """
+    Returns {url: entry} for the URLs with cached text. Each entry has "text", "etag",
+    "last_modified" and "fresh" (fetched within ARTICLE_CACHE_FRESH_MINUTES; stale
+    entries should be revalidated with a conditional GET before use).
+    """
+    if not ARTICLE_CACHE_ENABLED or not urls:
+        return {}
+    keys = {url: _cache_key(url) for url in urls}
+    try:
+        entries = get_article_cache_entries(set(keys.values()))
+    except Exception as e:
+        print(f"🟠 Article cache lookup failed: {e}")
+        return {}
+    fresh_after = datetime.now(timezone.utc) - timedelta(minutes=ARTICLE_CACHE_FRESH_MINUTES)
+    found = {}
+    for url, key in keys.items():
+        if key in entries:
+            entry = entries[key]
+            found[url] = {**entry, "fresh": entry["fetched_at"] > fresh_after}
+    return found
+
+def store_article(url, text, etag=None, last_modified=None):
+    """Caches extracted text with its response validators. Empty extractions are not cached."""
+    global _writes_since_eviction
+    if not ARTICLE_CACHE_ENABLED or not text:
+        return
+    try:
+        set_article_cache_entry(_cache_key(url), normalize_url(url), text, etag, last_modified)
+        with _writes_lock:
+            _writes_since_eviction += 1
+            evict = _writes_since_eviction >= ARTICLE_CACHE_EVICT_EVERY
+            if evict:
+                _writes_since_eviction = 0
+        if evict:
+            removed = evict_article_cache(ARTICLE_CACHE_MAX_ENTRIES)
+            if removed:
+                print(f"Evicted {removed} article cache entries.")
+    except Exception as e:
+        print(f"🟠 Article cache write failed: {e}")
+
+def mark_revalidated(url):
+    """Restarts a cached article's freshness window after the site answered 304 Not Modified."""
+    if not ARTICLE_CACHE_ENABLED:
+        return
+    try:
+        touch_article_cache_entry(_cache_key(url))
+    except Exception as e:
+        print(f"🟠 Article cache update failed: {e}")
@@ -0,0 +1,11 @@
+from newspaper import Article
+
+# Kept free of app imports so parse workers stay light. Spawned workers still re-import the main script
+# (app_ig.py under the dev server) as __mp_main__, which is why entry points keep startup work out of import time.
+
+def extract_article_text(url, html):
+    """Parses already-downloaded HTML with newspaper and returns the article text ('' if none was found)."""
+    article = Article(url)
+    article.download(input_html=html)
+    article.parse()
+    return article.text
@@ -1,20 +1,40 @@
 import os
-import requests
 import json
-import google.generativeai as genai
+import threading
+import multiprocessing
+import requests
 from urllib.parse import urlparse
 from datetime import datetime, timezone
-from database import article_exists, add_article
-from newspaper import Article
-
-# --- Gemini Configuration ---
-try:
-    gemini_api_key = os.environ["GEMINI"]
-    genai.configure(api_key=gemini_api_key)
-    gemini_model = genai.GenerativeModel('gemini-2.5-flash')
-except KeyError:
-    print("🔴 ERROR: GEMINI_API_KEY not found for article_handler.")
-    gemini_model = None
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from requests.adapters import HTTPAdapter
+from database import article_exists, add_article, get_seen_article_urls
+from stylizer import get_stylization_client
+from clients import get_gemini_model
+from llm_cache import cached_call, cached_call_many, cached_stylize_many
+from article_cache import lookup_articles, store_article, mark_revalidated
+from metrics import span, count, collect_timings, bind_timings, record_gemini_usage
+
+GEMINI_MODEL_NAME = 'gemini-2.5-flash'
+
+# --- Bulk URL Configuration ---
+URL_BATCH_MAX = int(os.environ.get("URL_BATCH_MAX", 20)) # Most URLs accepted by one /api/process-urls request
+URL_DOWNLOAD_WORKERS = int(os.environ.get("URL_DOWNLOAD_WORKERS", 8)) # Article pages downloaded at the same time
+URL_PER_DOMAIN_LIMIT = int(os.environ.get("URL_PER_DOMAIN_LIMIT", 2)) # Concurrent downloads per site, across all requests
+URL_DOWNLOAD_TIMEOUT = float(os.environ.get("URL_DOWNLOAD_TIMEOUT", 15)) # Per-page timeout in seconds
+URL_PARSE_PROCESSES = int(os.environ.get("URL_PARSE_PROCESSES", min(4, os.cpu_count() or 1))) # newspaper parse workers; 0 parses in-thread
+URL_GEMINI_BATCH_SIZE = int(os.environ.get("URL_GEMINI_BATCH_SIZE", 5)) # Articles summarized per Gemini call
+URL_USER_AGENT = "Mozilla/5.0 (compatible; VersusBot/1.0)"
+
+article_session = requests.Session()
+article_session.headers["User-Agent"] = URL_USER_AGENT
+article_session.mount("http://", HTTPAdapter(pool_connections=URL_DOWNLOAD_WORKERS, pool_maxsize=URL_DOWNLOAD_WORKERS))
+article_session.mount("https://", HTTPAdapter(pool_connections=URL_DOWNLOAD_WORKERS, pool_maxsize=URL_DOWNLOAD_WORKERS))
+
+_domain_limits = {}
+_domain_limits_lock = threading.Lock()
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
 
 SINGLE_ARTICLE_PROMPT_TEMPLATE = """
 You are a world-class sports news analyst. Your task is to analyze the provided article content and create a concise, engaging summary.
@@ -31,9 +51,183 @@ Here is the article content:
 ---
 """
 
+BATCH_ARTICLE_PROMPT_TEMPLATE = """
+You are a world-class sports news analyst. Your task is to analyze each of the provided articles and create a concise, engaging summary of each one.
+
+Instructions:
+1.  Read every article below. Each one has an "id" and its "content".
+2.  Generate a JSON array with exactly one object per article, each with three keys: "id", "headline", and "summary".
+3.  The "id" must be copied unchanged from the article it summarizes.
+4.  The "headline" should be a short, catchy title for the story.
+5.  The "summary" should be a one-paragraph summary of the key information and enough context about the subjects of the story to understand its significance.
+
+Here are the articles (JSON):
+---
+{articles}
+---
+"""
+
+def _domain_limit(url):
+    """Shared semaphore capping concurrent downloads from one site."""
+    domain = urlparse(url).netloc.lower()
+    with _domain_limits_lock:
+        if domain not in _domain_limits:
+            _domain_limits[domain] = threading.BoundedSemaphore(URL_PER_DOMAIN_LIMIT)
+        return _domain_limits[domain]
+
+def download_page(url, cached=None):
+    """
+    Downloads an article page through the pooled session, within the site's concurrency limit.
+    With a cached entry the request is conditional. Returns (html, etag, last_modified),
+    where html is None when the site answered 304 Not Modified.
+    """
+    headers = {}
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+    with _domain_limit(url):
+        with span("article_download"):
+            response = article_session.get(url, headers=headers, timeout=URL_DOWNLOAD_TIMEOUT)
+            if response.status_code == 304 and cached:
+                return None, None, None
+            response.raise_for_status()
+            return response.text, response.headers.get("ETag"), response.headers.get("Last-Modified")
+
+def _get_parse_pool():
+    """
+    Lazily starts the parse processes. Spawned children import article_extract and re-import the main
+    script as __mp_main__, so entry points must keep side effects (DB migrations, threads) under __main__.
+    """
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            _parse_pool = ProcessPoolExecutor(max_workers=URL_PARSE_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+        return _parse_pool
+
+def submit_extract(url, html):
+    """Parses the page in the process pool (or right away when URL_PARSE_PROCESSES is 0). Returns a future."""
+    global _parse_pool
+    from article_extract import extract_article_text # newspaper is slow to import; load it on first use
+    if URL_PARSE_PROCESSES > 0:
+        try:
+            return _get_parse_pool().submit(extract_article_text, url, html)
+        except BrokenProcessPool:
+            print("🟠 Parse pool died; starting a new one.")
+            with _parse_pool_lock:
+                _parse_pool = None
+            return _get_parse_pool().submit(extract_article_text, url, html)
+    future = Future()
+    try:
+        future.set_result(extract_article_text(url, html))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+def fetch_article_text(url):
+    """
+    Extracted text for one URL. Fresh cache entries skip the network; stale ones are
+    revalidated with a conditional GET; anything else is downloaded, parsed and cached.
+    """
+    cached = lookup_articles([url]).get(url)
+    if cached and cached["fresh"]:
+        count("article_cache", result="hit")
+        return cached["text"]
+    html, etag, last_modified = download_page(url, cached)
+    if html is None:
+        count("article_cache", result="revalidated")
+        mark_revalidated(url)
+        return cached["text"]
+    count("article_cache", result="miss")
+    with span("article_parse"):
+        article_text = submit_extract(url, html).result()
+    store_article(url, article_text, etag, last_modified)
+    return article_text
+
+def _parse_json(response_text):
+    return json.loads(response_text.strip().replace("```json", "").replace("```", ""))
+
+def summarize_article(article_text):
+    """Headline and summary for one article; shares its cache entries with summarize_articles."""
+    def summarize_with_gemini():
+        prompt = SINGLE_ARTICLE_PROMPT_TEMPLATE.format(article_text=article_text)
+        with span("gemini_call"):
+            response = get_gemini_model(GEMINI_MODEL_NAME).generate_content(prompt)
+        record_gemini_usage(response, GEMINI_MODEL_NAME)
+        return _parse_json(response.text)
+
+    return dict(cached_call("summarize", GEMINI_MODEL_NAME, SINGLE_ARTICLE_PROMPT_TEMPLATE, article_text, summarize_with_gemini))
+
+def summarize_articles(article_texts):
+    """
+    Headlines and summaries for several articles in one Gemini call. Cache entries are
+    keyed like summarize_article's, so single and bulk requests reuse each other's results.
+    Articles the batch answer leaves out are retried one by one; failures come back as None.
+    """
+    def summarize_batch(texts):
+        articles = json.dumps([{"id": index, "content": text} for index, text in enumerate(texts)])
+        try:
+            with span("gemini_call", batch="1"):
+                response = get_gemini_model(GEMINI_MODEL_NAME).generate_content(BATCH_ARTICLE_PROMPT_TEMPLATE.format(articles=articles))
+            record_gemini_usage(response, GEMINI_MODEL_NAME)
+            answers = {item.get("id"): item for item in _parse_json(response.text) if isinstance(item, dict)}
+        except Exception as e:
+            print(f"🟠 Batch summary failed, summarizing articles one by one: {e}")
+            answers = {}
+
+        results = []
+        for index, text in enumerate(texts):
+            answer = answers.get(index)
+            if answer and answer.get("headline") and answer.get("summary"):
+                results.append({"headline": answer["headline"], "summary": answer["summary"]})
+                continue
+            try:
+                results.append(summarize_article(text))
+            except Exception as e:
+                print(f"🔴 ERROR during Gemini analysis: {e}")
+                results.append(None)
+        return results
+
+    return cached_call_many("summarize", GEMINI_MODEL_NAME, SINGLE_ARTICLE_PROMPT_TEMPLATE, article_texts, summarize_batch)
+
+def stylize_and_store(url, user_id, news_item):
+    """Adds the Versus caption, saves the article for the user, and returns the finished item."""
+    inference_url = os.environ.get("KAGGLE_INFERENCE_URL")
+    if inference_url:
+        with span("stylize"):
+            news_item['versus_caption'] = cached_stylize_many(get_stylization_client(inference_url), [news_item['summary']])[0]
+    else:
+        news_item['versus_caption'] = "Kaggle URL not set. Stylization skipped."
+
+    try:
+        source_name = urlparse(url).netloc
+        with span("db_store", source="url"):
+            add_article(
+                url=url,
+                user_id=user_id,
+                headline=news_item['headline'],
+                source_name=source_name,
+                summary=news_item['summary'],
+                published_at=datetime.now(timezone.utc)
+            )
+        print(f"✅ Successfully processed and stored article from {url} for user {user_id}")
+    except Exception as e:
+        print(f"🔴 ERROR saving article to database: {e}")
+        # Don't block the user, just log the error and return the content
+        news_item["db_error"] = f"Could not save to database: {e}"
+    return news_item
+
 def process_single_url(url, user_id):
-    """Fetches, processes, and stores a single article from a URL."""
-    if not gemini_model:
+    """Fetches, processes, and stores a single article from a URL. The result carries per-stage `timings`."""
+    with collect_timings() as timings:
+        with span("process_url"):
+            result = _process_url(url, user_id)
+    result["timings"] = timings.as_dict()
+    return result
+
+def _process_url(url, user_id):
+    if not get_gemini_model(GEMINI_MODEL_NAME):
         return {"error": "Gemini API not configured."}
 
     # 1. Check if the article already exists for this user
@@ -43,58 +237,124 @@ def process_single_url(url, user_id):
     # 2. Fetch and extract article content
     try:
         print(f"Fetching content from URL: {url}")
-        article = Article(url)
-        article.download()
-        article.parse()
-        article_text = article.text
+        article_text = fetch_article_text(url)
         if not article_text:
             return {"error": "Could not extract content from the URL."}
     except Exception as e:
         print(f"🔴 ERROR during web fetch: {e}")
         return {"error": f"Failed to fetch or process URL: {e}"}
 
-    # 3. Use Gemini to generate headline and summary
+    # 3. Use Gemini to generate headline and summary (the same text is served from the LLM cache)
     try:
-        prompt = SINGLE_ARTICLE_PROMPT_TEMPLATE.format(article_text=article_text)
-        response = gemini_model.generate_content(prompt)
-        clean_response = response.text.strip().replace("```json", "").replace("```", "")
-        news_item = json.loads(clean_response)
+        news_item = summarize_article(article_text)
         news_item['source_caption'] = article_text[:500] + '...' # Truncate for storage
     except Exception as e:
         print(f"🔴 ERROR during Gemini analysis: {e}")
         return {"error": "Failed to analyze article with Gemini.", "details": str(e)}
 
-    # 4. Call Kaggle server for stylization
-    inference_url = os.environ.get("KAGGLE_INFERENCE_URL")
-    if inference_url:
-        try:
-            payload = {"summary": news_item['summary']}
-            response = requests.post(f"{inference_url}/generate-caption", json=payload, timeout=60)
-            if response.status_code == 200:
-                news_item['versus_caption'] = response.json().get('stylized_caption', 'Error: Invalid response.')
-            else:
-                news_item['versus_caption'] = f"Error: Server returned status {response.status_code}"
-        except requests.exceptions.RequestException as e:
-            print(f"🔴 ERROR connecting to Kaggle server: {e}")
-            news_item['versus_caption'] = "Error: Could not connect to inference server."
-    else:
-        news_item['versus_caption'] = "Kaggle URL not set. Stylization skipped."
+    # 4. Stylize and 5. store
+    return stylize_and_store(url, user_id, news_item)
+
+def process_urls(urls, user_id):
+    """
+    Bulk version of process_single_url. Cached articles skip the download (see
+    fetch_article_text), the rest download concurrently (per-site limited), parsing runs in the process pool, summaries go to Gemini URL_GEMINI_BATCH_SIZE at a
+    time, and captions are stylized in parallel. Yields one dict per URL as soon as it
+    finishes ("url", "status" of done/skipped/error, plus the item or the error), then a
+    final {"status": "complete", ...} line carrying the run's `timings`.
+    """
+    with collect_timings() as timings:
+        with span("process_urls"):
+            statuses = {}
+            for result in _process_urls(urls, user_id):
+                statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+                count("urls_processed", status=result["status"])
+                yield result
+    yield {"status": "complete", "counts": statuses, "timings": timings.as_dict()}
+
+def _process_urls(urls, user_id):
+    urls = list(dict.fromkeys(urls)) # Drop repeats, keep order
+    if not get_gemini_model(GEMINI_MODEL_NAME):
+        for url in urls:
+            yield {"url": url, "status": "error", "error": "Gemini API not configured."}
+        return
+
+    seen = get_seen_article_urls(user_id, urls)
+    for url in urls:
+        if url in seen:
+            yield {"url": url, "status": "skipped", "message": "This article has already been processed."}
+    urls = [url for url in urls if url not in seen]
+    if not urls:
+        return
+
+    downloads = ThreadPoolExecutor(max_workers=min(URL_DOWNLOAD_WORKERS, len(urls)), thread_name_prefix="url-download")
+    # Gemini batches and per-item stylize/store share one pool; both mostly wait on the network
+    workers = ThreadPoolExecutor(max_workers=max(4, URL_DOWNLOAD_WORKERS), thread_name_prefix="url-worker")
+    pending = {} # future -> (stage, payload)
+    ready = [] # (url, article_text) waiting for a Gemini batch
+    validators = {} # url -> (etag, last_modified) of a page being parsed
+
+    def submit_batches():
+        # Full batches go out at once; once nothing else can join it, send a partial batch rather than wait
+        extracting = any(stage in ("download", "parse") for stage, _ in pending.values())
+        while len(ready) >= URL_GEMINI_BATCH_SIZE or (ready and not extracting):
+            batch = ready[:URL_GEMINI_BATCH_SIZE]
+            del ready[:URL_GEMINI_BATCH_SIZE]
+            pending[workers.submit(bind_timings(summarize_articles), [text for _, text in batch])] = ("summarize", batch)
 
-    # 5. Add the new article to the database
     try:
-        source_name = urlparse(url).netloc
-        add_article(
-            url=url,
-            user_id=user_id,
-            headline=news_item['headline'],
-            source_name=source_name,
-            summary=news_item['summary'],
-            published_at=datetime.now(timezone.utc)
-        )
-        print(f"✅ Successfully processed and stored article from {url} for user {user_id}")
-    except Exception as e:
-        print(f"🔴 ERROR saving article to database: {e}")
-        # Don't block the user, just log the error and return the content
-        news_item["db_error"] = f"Could not save to database: {e}"
+        cached = lookup_articles(urls)
+        for url in urls:
+            entry = cached.get(url)
+            if entry and entry["fresh"]:
+                count("article_cache", result="hit")
+                ready.append((url, entry["text"]))
+            else:
+                pending[downloads.submit(bind_timings(download_page), url, entry)] = ("download", url)
+        submit_batches()
 
-    return news_item
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, payload = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"🔴 ERROR during {stage} of {payload}: {e}")
+                    if stage == "summarize":
+                        for url, _ in payload:
+                            yield {"url": url, "status": "error", "error": "Failed to analyze article with Gemini.", "details": str(e)}
+                    else:
+                        yield {"url": payload, "status": "error", "error": f"Failed to fetch or process URL: {e}"}
+                    continue
+
+                if stage == "download":
+                    html, etag, last_modified = result
+                    if html is None:
+                        count("article_cache", result="revalidated")
+                        mark_revalidated(payload)
+                        ready.append((payload, cached[payload]["text"]))
+                    else:
+                        count("article_cache", result="miss")
+                        validators[payload] = (etag, last_modified)
+                        pending[submit_extract(payload, html)] = ("parse", payload)
+                elif stage == "parse":
+                    store_article(payload, result, *validators.pop(payload))
+                    if not result:
+                        yield {"url": payload, "status": "error", "error": "Could not extract content from the URL."}
+                    else:
+                        ready.append((payload, result))
+                elif stage == "summarize":
+                    for (url, article_text), summary in zip(payload, result):
+                        if summary is None:
+                            yield {"url": url, "status": "error", "error": "Failed to analyze article with Gemini."}
+                            continue
+                        news_item = dict(summary, source_caption=article_text[:500] + '...')
+                        pending[workers.submit(bind_timings(stylize_and_store), url, user_id, news_item)] = ("stylize", url)
+                else:
+                    yield {"url": payload, "status": "done", **result}
+            submit_batches()
+    finally:
+        # Also runs when the client disconnects mid-stream: drop work that hasn't started
+        downloads.shutdown(wait=False, cancel_futures=True)
+        workers.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,85 @@
+"""
+Benchmarks clustering.cluster_texts on a synthetic feed where every story is
+reported several times with different wording, the way Fabrizio, 433, Goal and
+the RSS feeds repeat the same transfer within minutes.
+
+Usage: python benchmarks/bench_clustering.py [--sizes 10 20 100 500 2000] [--threshold 0.6] [--min-purity 0.99]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from clustering import cluster_texts, CLUSTER_SIMILARITY
+
+FIRST_NAMES = ["Marcus", "Joao", "Kylian", "Florian", "Bukayo", "Jamal", "Victor", "Alexander", "Rodrygo", "Dominik", "Nico", "Pedro"]
+SYLLABLES = ["ka", "ro", "vi", "del", "mar", "sto", "ne", "gu", "li", "ber", "zo", "tan", "mi", "os"]
+CLUBS = ["Arsenal", "Chelsea", "Liverpool", "Real Madrid", "Barcelona", "Bayern", "Juventus", "Napoli", "PSG", "Newcastle", "Milan", "Atletico"]
+TEMPLATES = [
+    "Here we go! {player} to {club}, agreement reached for a {fee}m fee. Medical booked for {day}. #{tag}",
+    "{club} have agreed a deal to sign {player} for {fee}m. {player} will undergo his medical on {day}.",
+    "BREAKING: {player} set to join {club} in a {fee}m move, medical on {day} 🚨",
+    "{player} to {club}: fee of {fee}m agreed, personal terms done and medical scheduled for {day}.",
+    "Exclusive: {club} close in on {player} with {fee}m agreed. Medical {day}, contract until 2030.",
+]
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+def make_corpus(stories, rng):
+    """Returns (texts, story_ids) with 1-5 rewordings per story, shuffled."""
+    texts, labels = [], []
+    for story in range(stories):
+        facts = {
+            # Invented surnames keep distinct stories from sharing a player by accident
+            "player": f"{rng.choice(FIRST_NAMES)} {''.join(rng.sample(SYLLABLES, 3)).title()}{story}",
+            "club": rng.choice(CLUBS),
+            "fee": rng.randrange(20, 120),
+            "day": rng.choice(DAYS),
+            "tag": f"Transfer{story}",
+        }
+        for template in rng.sample(TEMPLATES, rng.randint(1, 5)):
+            texts.append(template.format(**facts))
+            labels.append(story)
+    order = list(range(len(texts)))
+    rng.shuffle(order)
+    return [texts[i] for i in order], [labels[i] for i in order]
+
+def score(clusters, labels):
+    """Fraction of clusters holding a single story, and how many true stories were split."""
+    pure = sum(1 for members in clusters if len({labels[i] for i in members}) == 1)
+    clusters_per_story = {}
+    for members in clusters:
+        for story in {labels[i] for i in members}:
+            clusters_per_story[story] = clusters_per_story.get(story, 0) + 1
+    split = sum(1 for count in clusters_per_story.values() if count > 1)
+    return pure / len(clusters), split
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 20, 100, 500, 2000], help="Number of stories per run (small windows catch names that only look rare)")
+    parser.add_argument("--threshold", type=float, default=CLUSTER_SIMILARITY)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--min-purity", type=float, default=0.99, help="Exit non-zero if any size clusters less purely (merged stories are lost)")
+    args = parser.parse_args()
+
+    print(f"{'stories':>8} {'items':>7} {'clusters':>9} {'purity':>7} {'split':>6} {'best ms':>9}")
+    lowest_purity = 1.0
+    for size in args.sizes:
+        texts, labels = make_corpus(size, random.Random(args.seed))
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            clusters = cluster_texts(texts, args.threshold)
+            timings.append(time.perf_counter() - started)
+        purity, split = score(clusters, labels)
+        print(f"{size:>8} {len(texts):>7} {len(clusters):>9} {purity:>7.1%} {split:>6} {min(timings) * 1000:>9.1f}")
+        lowest_purity = min(lowest_purity, purity)
+
+    if lowest_purity < args.min_purity:
+        print(f"🔴 Purity {lowest_purity:.1%} is below {args.min_purity:.1%}: distinct stories are being merged.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
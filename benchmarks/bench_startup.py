@@ -0,0 +1,76 @@
+"""
+Benchmarks backend cold start: imports each entry module in a fresh interpreter
+(AUTO_MIGRATE=0, so startup makes no DB calls) and reports wall time, which heavy
+client libraries got loaded at import, and the slowest imports from -X importtime.
+
+Usage: python benchmarks/bench_startup.py [--modules app_ig ingest_worker article_handler] [--repeat 5] [--top 10]
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["google.generativeai", "instagrapi", "newspaper"] # Should load on first use, not at import
+PROBE = """
+import sys, json, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "heavy": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+def run_probe(module, importtime=False):
+    """Imports module in a new interpreter. Returns (probe result, stderr)."""
+    env = dict(os.environ, AUTO_MIGRATE="0")
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", PROBE.format(module=module, heavy=HEAVY_MODULES)]
+    completed = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr.strip()}")
+    return json.loads(completed.stdout.strip().splitlines()[-1]), completed.stderr
+
+def slowest_imports(importtime_output, module, top):
+    """Direct imports of module by cumulative import time (microseconds), from -X importtime output."""
+    children = []
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, raw_name = line[len("import time:"):].split("|")
+        depth = (len(raw_name) - len(raw_name.lstrip()) - 1) // 2
+        name = raw_name.strip()
+        # A module's imports are listed (one level deeper) just before the module itself
+        if depth == 1:
+            children.append((name, int(cumulative)))
+        elif depth == 0:
+            if name == module:
+                return sorted(children, key=lambda item: item[1], reverse=True)[:top]
+            children = []
+    return []
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--modules", nargs="+", default=["app_ig", "ingest_worker", "article_handler"])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Slowest direct imports to list per module")
+    args = parser.parse_args()
+
+    print(f"{'module':>16} {'best ms':>9} {'median ms':>10}  heavy modules loaded at import")
+    breakdowns = {}
+    for module in args.modules:
+        # The first run warms the bytecode cache and doubles as the -X importtime breakdown
+        _, stderr = run_probe(module, importtime=True)
+        breakdowns[module] = slowest_imports(stderr, module, args.top)
+        results = [run_probe(module)[0] for _ in range(args.repeat)]
+        timings = [result["seconds"] * 1000 for result in results]
+        heavy = ", ".join(results[-1]["heavy"]) or "none"
+        print(f"{module:>16} {min(timings):>9.1f} {statistics.median(timings):>10.1f}  {heavy}")
+
+    for module, slowest in breakdowns.items():
+        print(f"\nSlowest imports under {module}:")
+        for name, microseconds in slowest:
+            print(f"  {microseconds / 1000:>8.1f} ms  {name}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""
+Local stand-ins for every external service the backend talks to, for benchmarks:
+a stub instagrapi Client, a deterministic Gemini model, one HTTP fixture server
+(RSS feeds, article pages and the inference server's caption endpoints), and a
+throwaway Postgres database. Every fake call is counted in `calls`.
+"""
+import os
+import sys
+import json
+import time
+import types
+import zlib
+import itertools
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+
+class CallCounter:
+    """Thread-safe named counters for round trips to each fake service."""
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, value=1):
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+calls = CallCounter()
+
+# --- Synthetic content ---
+CLUBS = ["Arsenal", "Chelsea", "Liverpool", "Real Madrid", "Barcelona", "Bayern", "Juventus", "Napoli", "PSG", "Newcastle"]
+TEMPLATES = [
+    "Here we go! Player {story} to {club}, agreement reached for a {fee}m fee. Medical booked. #Transfer",
+    "{club} have agreed a deal to sign Player {story} for {fee}m, with the medical scheduled this week.",
+    "BREAKING: Player {story} set to join {club} in a {fee}m move, personal terms agreed.",
+]
+_story_sequence = itertools.count(1)
+
+def next_story_text():
+    """Returns fresh story text; consecutive calls report the same story twice, worded differently."""
+    n = next(_story_sequence)
+    story = n // 2
+    return TEMPLATES[n % len(TEMPLATES)].format(story=story, club=CLUBS[story % len(CLUBS)], fee=20 + story % 90)
+
+# --- Instagram ---
+class FakeMedia:
+    def __init__(self, pk, taken_at, caption_text):
+        self.pk = pk
+        self.taken_at = taken_at
+        self.caption_text = caption_text
+
+class FakeInstagramClient:
+    """Implements the instagrapi Client calls the backend makes. Every feed read returns fresh posts."""
+
+    latency = 0.0 # Seconds per API call
+    posts_per_call = 5
+    _pks = itertools.count(1_000_000)
+
+    def load_settings(self, path):
+        pass
+
+    def dump_settings(self, path):
+        pass
+
+    def login(self, username, password):
+        return True
+
+    def get_timeline_feed(self):
+        return {}
+
+    def user_id_from_username(self, username):
+        calls.add("instagram")
+        time.sleep(self.latency)
+        return zlib.crc32(username.encode())
+
+    def user_medias(self, user_id, amount=20):
+        calls.add("instagram")
+        time.sleep(self.latency)
+        now = datetime.now(timezone.utc)
+        return [FakeMedia(next(self._pks), now, next_story_text()) for _ in range(min(amount, self.posts_per_call))]
+
+# --- Gemini ---
+def _prompt_content(prompt):
+    """The prompt templates wrap their input in '---' lines; returns what's between the last pair."""
+    parts = prompt.rsplit("---", 2)
+    return parts[1].strip() if len(parts) == 3 else prompt
+
+class FakeGenerativeModel:
+    """Deterministic stand-in for genai.GenerativeModel that answers ranking, merge and (batch) summary prompts."""
+
+    latency = 0.0 # Seconds per call
+
+    def __init__(self, model_name, **kwargs):
+        self.model_name = model_name
+
+    def generate_content(self, prompt, **kwargs):
+        calls.add("gemini")
+        time.sleep(self.latency)
+        content = _prompt_content(prompt)
+        if "Here are the articles (JSON)" in prompt:
+            result = [{"id": article["id"], "headline": article["content"].splitlines()[0][:80], "summary": article["content"][:400]}
+                      for article in json.loads(content)]
+        elif "Shortlisted stories (JSON)" in prompt:
+            result = json.loads(content)[:5]
+        elif "Here is the article content" in prompt:
+            result = {"headline": content.splitlines()[0][:80], "summary": content[:400]}
+        else:
+            lines = [line for line in content.splitlines() if line.startswith("- @")]
+            result = [{"headline": line[:60], "summary": line.split(": ", 1)[-1], "source_caption": line} for line in lines[:5]]
+        text = json.dumps(result)
+        usage = types.SimpleNamespace(prompt_token_count=len(prompt) // 4, candidates_token_count=len(text) // 4)
+        return types.SimpleNamespace(text=text, usage_metadata=usage)
+
+def install_fake_clients():
+    """Registers fake google.generativeai and instagrapi modules. Call before importing news_pipeline."""
+    genai = types.ModuleType("google.generativeai")
+    genai.configure = lambda **kwargs: None
+    genai.GenerativeModel = FakeGenerativeModel
+    google = sys.modules.setdefault("google", types.ModuleType("google"))
+    google.generativeai = genai
+    sys.modules["google.generativeai"] = genai
+
+    instagrapi = types.ModuleType("instagrapi")
+    instagrapi.Client = FakeInstagramClient
+    exceptions = types.ModuleType("instagrapi.exceptions")
+    exceptions.LoginRequired = type("LoginRequired", (Exception,), {})
+    instagrapi.exceptions = exceptions
+    sys.modules["instagrapi"] = instagrapi
+    sys.modules["instagrapi.exceptions"] = exceptions
+
+# --- RSS feeds, article pages and the inference server ---
+class _FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, like the real services
+
+    def _send(self, status, body, content_type):
+        body = body.encode() if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        fixture = self.server.fixture
+        if self.path.startswith("/feeds/"):
+            calls.add("rss")
+            time.sleep(fixture.rss_latency)
+            self._send(200, fixture.render_feed(self.path), "application/rss+xml")
+        elif self.path.startswith("/articles/"):
+            calls.add("article")
+            time.sleep(fixture.article_latency)
+            self._send(200, fixture.render_article(self.path), "text/html; charset=utf-8")
+        else:
+            self._send(404, "Not found", "text/plain")
+
+    def do_POST(self):
+        fixture = self.server.fixture
+        data = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path == "/generate-caption":
+            calls.add("caption")
+            time.sleep(fixture.caption_latency)
+            self._send(200, json.dumps({"stylized_caption": f"VERSUS: {data.get('summary', '')[:120]}"}), "application/json")
+        elif self.path == "/generate-captions":
+            calls.add("caption")
+            time.sleep(fixture.caption_latency)
+            captions = [f"VERSUS: {summary[:120]}" for summary in data.get("summaries", [])]
+            self._send(200, json.dumps({"stylized_captions": captions}), "application/json")
+        else:
+            self._send(404, "Not found", "text/plain")
+
+    def log_message(self, format, *args):
+        pass
+
+class FixtureServer:
+    """One local HTTP server for feeds (/feeds/<n>.xml), articles (/articles/<n>) and caption generation."""
+
+    def __init__(self, feeds=5, items_per_feed=10, paragraphs=8, rss_latency=0.0, article_latency=0.0, caption_latency=0.0):
+        self.feeds = feeds
+        self.items_per_feed = items_per_feed
+        self.paragraphs = paragraphs
+        self.rss_latency = rss_latency
+        self.article_latency = article_latency
+        self.caption_latency = caption_latency
+        self._articles = itertools.count(1)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _FixtureHandler)
+        self.server.daemon_threads = True
+        self.server.fixture = self
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, name="fixture-server", daemon=True).start()
+
+    def feed_registry(self):
+        return [
+            {"name": f"Fixture Feed {n}", "url": f"{self.base_url}/feeds/{n}.xml", "poll_interval_minutes": 0}
+            for n in range(self.feeds)
+        ]
+
+    def next_article_url(self):
+        return f"{self.base_url}/articles/{next(self._articles)}"
+
+    def render_feed(self, path):
+        """Every request returns items_per_feed fresh items, so each fetch has new content to store."""
+        pub_date = format_datetime(datetime.now(timezone.utc))
+        items = []
+        for _ in range(self.items_per_feed):
+            text = escape(next_story_text())
+            link = self.next_article_url()
+            items.append(
+                f"<item><title>{text[:70]}</title><link>{link}</link><guid>{link}</guid>"
+                f"<description>{text}</description><pubDate>{pub_date}</pubDate></item>"
+            )
+        return f'<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel><title>{escape(path)}</title>{"".join(items)}</channel></rss>'
+
+    def render_article(self, path):
+        paragraphs = "".join(f"<p>{escape(next_story_text())} {'Sources close to the club confirmed the details. ' * 3}</p>" for _ in range(self.paragraphs))
+        headline = escape(next_story_text())
+        return f"<html><head><title>{headline}</title></head><body><article><h1>{headline}</h1>{paragraphs}</article></body></html>"
+
+    def close(self):
+        self.server.shutdown()
+
+# --- Postgres ---
+def count_db_round_trips(database):
+    """Makes every connection the pool opens count statements executed through its cursors as `db` calls."""
+    from psycopg2.extensions import cursor
+
+    class CountingCursor(cursor):
+        def execute(self, query, vars=None):
+            calls.add("db")
+            return super().execute(query, vars)
+
+        def executemany(self, query, vars_list):
+            calls.add("db")
+            return super().executemany(query, vars_list)
+
+    get_connection_kwargs = database.get_connection_kwargs
+    database.get_connection_kwargs = lambda: {**get_connection_kwargs(), "cursor_factory": CountingCursor}
+
+@contextmanager
+def throwaway_database(admin_dsn):
+    """
+    Creates an empty database through admin_dsn, points the POSTGRES_* variables at it,
+    and drops it afterwards. Yields the database name.
+    """
+    import psycopg2
+    from psycopg2 import sql
+    from psycopg2.extensions import parse_dsn
+
+    params = parse_dsn(admin_dsn)
+    name = f"versus_bench_{os.getpid()}"
+    admin = psycopg2.connect(admin_dsn)
+    admin.autocommit = True
+    with admin.cursor() as cur:
+        cur.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(name)))
+    os.environ.update(
+        POSTGRES_HOST=params.get("host", "localhost"),
+        POSTGRES_PORT=str(params.get("port", 5432)),
+        POSTGRES_USER=params.get("user", ""),
+        POSTGRES_PASSWORD=params.get("password", ""),
+        POSTGRES_DB=name,
+    )
+    try:
+        yield name
+    finally:
+        if "database" in sys.modules:
+            sys.modules["database"].close_db_pool()
+        with admin.cursor() as cur:
+            cur.execute(sql.SQL("DROP DATABASE IF EXISTS {} WITH (FORCE)").format(sql.Identifier(name)))
+        admin.close()
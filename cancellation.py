@@ -0,0 +1,74 @@
+import os
+import time
+import threading
+
+# --- Cancellation Configuration ---
+CANCEL_POLL_SECONDS = float(os.environ.get("CANCEL_POLL_SECONDS", 1.0)) # How often a running job re-checks Postgres for a cancel
+
+class Cancelled(Exception):
+    """Raised when the job a piece of work belongs to was cancelled."""
+
+class CancellationToken:
+    """
+    Cancellation flag for one pipeline run. A token bound to an ingest job also
+    watches the job's row, so a cancel issued by any web worker reaches the
+    process running it. Checks are cheap: Postgres is read at most once per
+    CANCEL_POLL_SECONDS no matter how many threads ask.
+    """
+
+    def __init__(self, job_id=None, poll_seconds=None):
+        self.job_id = job_id
+        self.poll_seconds = CANCEL_POLL_SECONDS if poll_seconds is None else poll_seconds
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+
+    def cancel(self):
+        self._event.set()
+
+    def is_cancelled(self):
+        if self._event.is_set():
+            return True
+        if self.job_id is None:
+            return False
+        with self._lock:
+            if time.monotonic() - self._checked_at >= self.poll_seconds:
+                self._checked_at = time.monotonic()
+                from database import is_ingest_job_cancelled
+                try:
+                    if is_ingest_job_cancelled(self.job_id):
+                        self._event.set()
+                except Exception as e:
+                    print(f"🟠 Could not check cancellation for job {self.job_id}: {e}")
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self.is_cancelled():
+            raise Cancelled()
+
+def run_cancellable(fn, token, poll_seconds=0.25):
+    """
+    Runs a blocking call (e.g. a Gemini request) on a helper thread and returns its result,
+    raising Cancelled as soon as the token is cancelled. The abandoned call finishes in the
+    background; its result is discarded.
+    """
+    if token is None:
+        return fn()
+    token.raise_if_cancelled()
+    outcome = {}
+    done = threading.Event()
+
+    def run():
+        try:
+            outcome["value"] = fn()
+        except BaseException as e:
+            outcome["error"] = e
+        finally:
+            done.set()
+
+    threading.Thread(target=run, name="cancellable-call", daemon=True).start()
+    while not done.wait(poll_seconds):
+        token.raise_if_cancelled()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["value"]
@@ -0,0 +1,151 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from metrics import span, count # Upload metrics.py alongside this file
+
+# --- Prompting Strategy ---
+SYSTEM_PROMPT = "You are a creative sports journalist for @versus. Your task is to write an exciting, high-energy, and stylized caption based on the news provided. Do not fact-check the news; accept it as true and write a caption in the signature @versus style."
+USER_PROMPT_TEMPLATE = "Write a sports caption in the @versus style about this news: {news_snippet}"
+
+def format_prompt(tokenizer, news_snippet):
+    """Applies the chat template, falling back to plain text for models without one (e.g. tiny test models)."""
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": USER_PROMPT_TEMPLATE.format(news_snippet=news_snippet)},
+    ]
+    if getattr(tokenizer, "chat_template", None):
+        return tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+    return f"{SYSTEM_PROMPT}\n\n{messages[1]['content']}\n\n"
+
+def generate_captions(model, tokenizer, summaries, device, max_new_tokens=1536, **generate_kwargs):
+    """
+    Generates one caption per summary with a single padded `generate` call.
+    The tokenizer must pad on the left so every prompt ends at the same position.
+    """
+    with span("tokenize"):
+        prompts = [format_prompt(tokenizer, summary) for summary in summaries]
+        inputs = tokenizer(prompts, return_tensors="pt", padding=True).to(device)
+    with span("generate"):
+        outputs = model.generate(
+            **inputs,
+            max_new_tokens=max_new_tokens,
+            pad_token_id=tokenizer.pad_token_id,
+            eos_token_id=tokenizer.eos_token_id,
+            **generate_kwargs
+        )
+    prompt_length = inputs.input_ids.shape[1]
+    with span("decode"):
+        new_tokens = outputs[:, prompt_length:]
+        captions = [tokenizer.decode(output, skip_special_tokens=True).strip() for output in new_tokens]
+    count("batches")
+    count("captions", len(summaries))
+    count("llm_tokens", int(inputs.attention_mask.sum()), type="prompt")
+    if tokenizer.pad_token_id is not None:
+        count("llm_tokens", int((new_tokens != tokenizer.pad_token_id).sum()), type="completion")
+    return captions
+
+def stream_caption(model, tokenizer, summary, device, max_new_tokens=1536, **generate_kwargs):
+    """
+    Yields caption text pieces as they are generated, via TextIteratorStreamer.
+    Closing the generator (e.g. the client disconnected) stops generation early.
+    """
+    from transformers import TextIteratorStreamer, StoppingCriteria, StoppingCriteriaList
+
+    class StopWhenSet(StoppingCriteria):
+        def __init__(self, event):
+            self.event = event
+
+        def __call__(self, input_ids, scores, **kwargs):
+            return self.event.is_set()
+
+    stop_event = threading.Event()
+    with span("tokenize"):
+        inputs = tokenizer(format_prompt(tokenizer, summary), return_tensors="pt").to(device)
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    generation = threading.Thread(
+        target=model.generate,
+        kwargs=dict(
+            **inputs,
+            streamer=streamer,
+            max_new_tokens=max_new_tokens,
+            pad_token_id=tokenizer.pad_token_id,
+            eos_token_id=tokenizer.eos_token_id,
+            stopping_criteria=StoppingCriteriaList([StopWhenSet(stop_event)]),
+            **generate_kwargs
+        ),
+        daemon=True,
+    )
+    generation.start()
+    try:
+        with span("generate_stream"):
+            for text in streamer:
+                if text:
+                    yield text
+    finally:
+        stop_event.set()
+        generation.join()
+
+class MicroBatcher:
+    """
+    Groups requests that arrive within `max_wait_ms` of each other (up to
+    `max_batch_size`) into a single call to `generate_batch(summaries) -> captions`.
+    One background thread owns the model, so batches never run concurrently.
+    """
+
+    def __init__(self, generate_batch, max_batch_size=8, max_wait_ms=50):
+        self.generate_batch = generate_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="caption-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, summary):
+        """Queues one summary and returns a Future resolving to its caption."""
+        future = Future()
+        self._queue.put((summary, future))
+        return future
+
+    def generate(self, summaries, timeout=None):
+        """Queues several summaries and blocks until all captions are ready, in order."""
+        futures = [self.submit(summary) for summary in summaries]
+        return [future.result(timeout=timeout) for future in futures]
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _collect_batch(self):
+        try:
+            batch = [self._queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stopped.is_set():
+            batch = self._collect_batch()
+            if not batch:
+                continue
+            summaries = [summary for summary, _ in batch]
+            try:
+                captions = self.generate_batch(summaries)
+                if len(captions) != len(batch):
+                    raise RuntimeError(f"Expected {len(batch)} captions, got {len(captions)}.")
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), caption in zip(batch, captions):
+                future.set_result(caption)
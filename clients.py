@@ -0,0 +1,89 @@
+import os
+import threading
+
+# --- Client Factory Configuration ---
+INSTA_SESSION_FILE = "session.json"
+
+class ClientUnavailable(Exception):
+    """Raised when a client can't be built: missing credentials or a failed login."""
+
+_gemini_models = {}
+_gemini_lock = threading.Lock()
+_instagram_client = None
+_instagram_lock = threading.Lock()
+
+def get_gemini_model(model_name):
+    """
+    Configures google.generativeai on first use and returns the shared model for model_name.
+    Returns None when GEMINI is not set.
+    """
+    with _gemini_lock:
+        if model_name not in _gemini_models:
+            api_key = os.environ.get("GEMINI")
+            if not api_key:
+                print("🔴 ERROR: GEMINI_API_KEY not found in .env file.")
+                return None
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            _gemini_models[model_name] = genai.GenerativeModel(model_name)
+            print(f"✅ Gemini API configured ({model_name}).")
+        return _gemini_models[model_name]
+
+def get_instagram_client():
+    """
+    Returns the shared instagrapi Client, logging in on first use (reusing session.json).
+    Concurrent callers wait for the one login. A failed login raises ClientUnavailable
+    and is retried on the next call.
+    """
+    global _instagram_client
+    with _instagram_lock:
+        if _instagram_client is None:
+            _instagram_client = _login_instagram()
+        return _instagram_client
+
+def _login_instagram():
+    try:
+        insta_username = os.environ["INSTA_USERNAME"]
+        insta_password = os.environ["INSTA_PASSWORD"]
+    except KeyError as e:
+        raise ClientUnavailable(f"Missing Instagram credential in .env file: {e}")
+
+    from instagrapi import Client
+    from instagrapi.exceptions import LoginRequired
+    cl = Client()
+    try:
+        if os.path.exists(INSTA_SESSION_FILE):
+            cl.load_settings(INSTA_SESSION_FILE)
+            print("✅ Instagram session loaded from file.")
+            try:
+                cl.get_timeline_feed()
+                print("✅ Instagram session is valid.")
+            except LoginRequired:
+                print("🟠 Instagram session expired. Logging in again.")
+                cl.login(insta_username, insta_password)
+                cl.dump_settings(INSTA_SESSION_FILE)
+        else:
+            print("🟠 No Instagram session file found. Logging in for the first time.")
+            cl.login(insta_username, insta_password)
+            cl.dump_settings(INSTA_SESSION_FILE)
+    except Exception as e:
+        raise ClientUnavailable(f"Instagram login failed: {e}") from e
+    return cl
+
+def warm_instagram_client(on_ready=None):
+    """
+    Validates the Instagram session (or logs in) on a daemon thread, so startup
+    doesn't wait on the network. `on_ready` is called with the client once logged in.
+    """
+    def warm():
+        try:
+            client = get_instagram_client()
+        except ClientUnavailable as e:
+            print(f"🔴 ERROR: {e}")
+            return
+        if on_ready is not None:
+            on_ready(client)
+
+    thread = threading.Thread(target=warm, name="instagram-login", daemon=True)
+    thread.start()
+    return thread
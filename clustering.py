@@ -0,0 +1,133 @@
+import os
+import re
+import math
+from collections import Counter
+import numpy as np
+
+# --- Clustering Configuration ---
+CLUSTER_SIMILARITY = float(os.environ.get("CLUSTER_SIMILARITY", 0.6)) # TF-IDF cosine at which two items tell the same story
+CLUSTER_NAME_MAX_SHARE = 0.02 # Names in more of the texts than this (clubs, weekdays) don't identify a story
+CLUSTER_BLOCK_SIZE = 512 # Similarity rows computed per matrix multiply; bounds memory at block x n floats
+
+_URL_PATTERN = re.compile(r"https?://\S+")
+_WORD_PATTERN = re.compile(r"\w\w+")
+STOP_WORDS = frozenset("""
+a an and are as at be been but by for from has have he her his in is it its of on or our she that the
+their them they this to was we were will with you your after over about into than then there what when
+who has had not no so up out more new just all here go
+""".split())
+
+def tokenize(text):
+    text = _URL_PATTERN.sub(" ", text.lower())
+    return [word for word in _WORD_PATTERN.findall(text) if word not in STOP_WORDS and not word.isdigit()]
+
+def name_terms(text):
+    """
+    Capitalised words that don't open a sentence (players, clubs, places), as tokenize() spells them.
+    Sentence openers are skipped so template words like "Exclusive:" or "BREAKING" don't count as names.
+    """
+    text = _URL_PATTERN.sub(" ", text)
+    terms = set()
+    for match in _WORD_PATTERN.finditer(text):
+        word = match.group()
+        if not word[0].isupper():
+            continue
+        before = text[:match.start()].rstrip(" \t")
+        if not before or before[-1] in ".!?\n":
+            continue
+        word = word.lower()
+        if word not in STOP_WORDS and not word.isdigit():
+            terms.add(word)
+    return terms
+
+def distinctive_names(texts):
+    """
+    Each text's names that at most CLUSTER_NAME_MAX_SHARE of the texts use (at least 10), so the
+    player in a transfer counts but clubs, weekdays and first names repeated across stories don't.
+    A word capitalised mid-sentence in any text is a name in every text, including where it opens a
+    sentence, so two reports of one story list the same names whatever their word order.
+    """
+    vocabulary = set().union(*(name_terms(text) for text in texts))
+    names = [set(tokenize(text)) & vocabulary for text in texts]
+    document_frequency = Counter(term for terms in names for term in terms)
+    common = max(10, CLUSTER_NAME_MAX_SHARE * len(texts))
+    return [{term for term in terms if document_frequency[term] <= common} for terms in names]
+
+def names_conflict(names, other):
+    """True when each text has a distinctive name the other lacks: they're about different people."""
+    return bool(names - other) and bool(other - names)
+
+def tfidf_matrix(texts):
+    """
+    Returns L2-normalised TF-IDF rows (float32) for texts. Only terms shared by two or more
+    texts get a column, since the rest can't add to any similarity; they still count in each norm.
+    """
+    term_counts = [Counter(tokenize(text)) for text in texts]
+    document_frequency = Counter(term for counts in term_counts for term in counts)
+    total = len(texts)
+    idf = {term: math.log((1 + total) / (1 + df)) + 1 for term, df in document_frequency.items()}
+    columns = {term: i for i, term in enumerate(term for term, df in document_frequency.items() if df > 1)}
+
+    matrix = np.zeros((total, len(columns)), dtype=np.float32)
+    norms = np.ones(total, dtype=np.float32)
+    for row, counts in enumerate(term_counts):
+        squared = 0.0
+        for term, count in counts.items():
+            weight = (1 + math.log(count)) * idf[term]
+            squared += weight * weight
+            column = columns.get(term)
+            if column is not None:
+                matrix[row, column] = weight
+        if squared:
+            norms[row] = math.sqrt(squared)
+    matrix /= norms[:, None]
+    return matrix
+
+def cluster_texts(texts, threshold=None, block_size=None):
+    """
+    Groups near-duplicate texts by TF-IDF cosine similarity. Texts are visited in order and
+    each unassigned one seeds a cluster that takes every later unassigned text similar to it,
+    so stories can't chain together through loosely related items. Texts that each carry a
+    distinctive name the other lacks are never merged, so different transfers written from the
+    same template ("Exclusive: {club} close in on {player}") stay apart.
+    Returns clusters as lists of indices, ordered by their seed; members keep input order.
+    """
+    threshold = CLUSTER_SIMILARITY if threshold is None else threshold
+    block_size = block_size or CLUSTER_BLOCK_SIZE
+    if not texts:
+        return []
+
+    matrix = tfidf_matrix(texts)
+    names = distinctive_names(texts)
+    positions = np.arange(len(texts))
+    unassigned = np.ones(len(texts), dtype=bool)
+    clusters = []
+    for start in range(0, len(texts), block_size):
+        # One matrix multiply per block of rows instead of one per seed
+        similar = (matrix[start:start + block_size] @ matrix.T) >= threshold
+        for offset, row in enumerate(similar):
+            seed = start + offset
+            if not unassigned[seed]:
+                continue
+            members = np.nonzero(row & unassigned & (positions >= seed))[0]
+            if names[seed]:
+                # Texts without distinctive names (e.g. all-lowercase captions) are judged on similarity alone
+                members = members[[not names_conflict(names[seed], names[i]) for i in members]]
+            unassigned[members] = False
+            unassigned[seed] = False
+            clusters.append(sorted(set(members.tolist()) | {seed}))
+    return clusters
+
+def cluster_items(items, threshold=None):
+    """
+    Collapses near-duplicate {"source", "text"} items into one representative per story.
+    The longest text in a cluster is kept (it usually carries the most context) and
+    every source that reported the story is listed in "sources", in input order.
+    """
+    clusters = cluster_texts([item["text"] for item in items], threshold)
+    representatives = []
+    for members in clusters:
+        best = max(members, key=lambda i: len(items[i]["text"]))
+        sources = list(dict.fromkeys(items[i]["source"] for i in members))
+        representatives.append({**items[best], "sources": sources})
+    return representatives
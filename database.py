@@ -1,24 +1,203 @@
 import os
+import html
+import time
+import threading
+from contextlib import contextmanager
 import psycopg2
 from psycopg2 import sql
 from psycopg2 import errors
+from psycopg2 import pool
+from psycopg2.extras import execute_values, Json
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
 from dotenv import load_dotenv
 
 load_dotenv()
 
-def get_db_connection():
-    conn = psycopg2.connect(
-        host="localhost",
+# --- Connection Pool Configuration ---
+DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30)) # Seconds to wait for a free connection
+DB_POOL_HEALTH_CHECK_SECONDS = float(os.environ.get("DB_POOL_HEALTH_CHECK_SECONDS", 30)) # Ping connections idle longer than this
+
+# --- Saved Captions Configuration ---
+CAPTIONS_PAGE_SIZE = int(os.environ.get("CAPTIONS_PAGE_SIZE", 20)) # Captions per /api/captions page by default
+CAPTIONS_PAGE_MAX = 100 # Largest page a client can ask for
+CAPTION_PREVIEW_CHARS = 200 # Summary characters sent in list pages; the full text is fetched per caption
+
+# --- Search Configuration ---
+SEARCH_TEXT_CONFIG = "english" # Postgres text search config baked into the search_vector columns (changing it needs a migration)
+SEARCH_MAX_CANDIDATES = int(os.environ.get("SEARCH_MAX_CANDIDATES", 1000)) # Newest matches per content type that get ranked
+# ts_headline marks matches with private-use sentinels; snippets are HTML-escaped before they become <mark></mark>
+SEARCH_MATCH_START, SEARCH_MATCH_STOP = "\ue000", "\ue001"
+SEARCH_HEADLINE_OPTIONS = f"StartSel={SEARCH_MATCH_START}, StopSel={SEARCH_MATCH_STOP}, MaxWords=35, MinWords=15, MaxFragments=2"
+SEARCH_PAGE_SIZE = 20 # Results per /api/search page by default
+SEARCH_PAGE_MAX = 50 # Largest page a client can ask for
+
+# --- Schema Configuration ---
+AUTO_MIGRATE = os.environ.get("AUTO_MIGRATE", "1") == "1" # Run init_db when the app or worker starts; 0 leaves it to migrate.py
+
+def get_connection_kwargs():
+    return dict(
+        host=os.environ.get("POSTGRES_HOST", "localhost"),
         database=os.environ["POSTGRES_DB"],
         user=os.environ["POSTGRES_USER"],
         password=os.environ["POSTGRES_PASSWORD"],
         port=os.environ.get("POSTGRES_PORT", 5432)
     )
-    return conn
+
+class DatabasePool:
+    """Thread-safe psycopg2 connection pool with checkout health checks and metrics."""
+
+    def __init__(self, minconn, maxconn, timeout, health_check_seconds, **connection_kwargs):
+        self._pool = pool.ThreadedConnectionPool(minconn, maxconn, **connection_kwargs)
+        # ThreadedConnectionPool raises instead of blocking when exhausted, so a
+        # semaphore sized to maxconn makes callers wait for a free slot instead.
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._last_used = {}
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_seconds = health_check_seconds
+        self._metrics = {
+            "in_use": 0,
+            "checkouts": 0,
+            "waits": 0,
+            "wait_timeouts": 0,
+            "reconnects": 0,
+            "checkout_seconds_total": 0.0,
+            "checkout_seconds_max": 0.0,
+        }
+
+    def getconn(self):
+        start = time.monotonic()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._metrics["waits"] += 1
+            if not self._slots.acquire(timeout=self.timeout):
+                with self._lock:
+                    self._metrics["wait_timeouts"] += 1
+                raise pool.PoolError(f"Timed out after {self.timeout}s waiting for a database connection.")
+        try:
+            conn = self._pool.getconn()
+            if not self._is_healthy(conn):
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+                with self._lock:
+                    self._metrics["reconnects"] += 1
+        except Exception:
+            self._slots.release()
+            raise
+
+        elapsed = time.monotonic() - start
+        with self._lock:
+            self._metrics["in_use"] += 1
+            self._metrics["checkouts"] += 1
+            self._metrics["checkout_seconds_total"] += elapsed
+            self._metrics["checkout_seconds_max"] = max(self._metrics["checkout_seconds_max"], elapsed)
+        return conn
+
+    def putconn(self, conn):
+        close = bool(conn.closed)
+        if not close and conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                close = True
+        with self._lock:
+            if close:
+                self._last_used.pop(id(conn), None)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+            self._metrics["in_use"] -= 1
+        self._pool.putconn(conn, close=close)
+        self._slots.release()
+
+    def _is_healthy(self, conn):
+        """Checks a connection on checkout, pinging it only if it has been idle for a while."""
+        if conn.closed:
+            return False
+        with self._lock:
+            last_used = self._last_used.get(id(conn))
+        if last_used is not None and time.monotonic() - last_used < self.health_check_seconds:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def metrics(self):
+        with self._lock:
+            snapshot = dict(self._metrics)
+        checkouts = snapshot["checkouts"]
+        snapshot["checkout_seconds_avg"] = snapshot["checkout_seconds_total"] / checkouts if checkouts else 0.0
+        snapshot["min_size"] = self.minconn
+        snapshot["max_size"] = self.maxconn
+        return snapshot
+
+    def closeall(self):
+        self._pool.closeall()
+
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+def get_db_pool():
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                _db_pool = DatabasePool(
+                    DB_POOL_MIN,
+                    DB_POOL_MAX,
+                    DB_POOL_TIMEOUT,
+                    DB_POOL_HEALTH_CHECK_SECONDS,
+                    **get_connection_kwargs()
+                )
+    return _db_pool
+
+def close_db_pool():
+    """
+    Closes this process's pool; the next get_db_pool() opens a new one. Call it in a
+    pre-fork server before workers start so they never share the parent's connections.
+    """
+    global _db_pool
+    with _db_pool_lock:
+        if _db_pool is not None:
+            _db_pool.closeall()
+            _db_pool = None
+
+def get_pool_metrics(open_only=False):
+    """This process's pool stats. With open_only, a process that hasn't opened its pool yet reports {} instead of opening one."""
+    if open_only:
+        db_pool = _db_pool
+        return db_pool.metrics() if db_pool is not None else {}
+    return get_db_pool().metrics()
+
+@contextmanager
+def get_db_connection():
+    """Checks a connection out of the shared pool and returns it when the block exits."""
+    db_pool = get_db_pool()
+    conn = db_pool.getconn()
+    try:
+        yield conn
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        db_pool.putconn(conn)
 
 def init_db():
-    conn = get_db_connection()
-    cur = conn.cursor()
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        _create_tables(cur)
+        conn.commit()
+        cur.close()
+
+def _create_tables(cur):
     
     # Create users table
     cur.execute("""
@@ -29,33 +208,39 @@ def init_db():
         );
     """)
 
-    # Create posts table for Instagram content with user_id
-    # Add user_id and composite unique constraint if not exists
+    # Create posts table for Instagram content, stored once and shared by all users
     cur.execute("""
         CREATE TABLE IF NOT EXISTS posts (
             id SERIAL PRIMARY KEY,
-            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-            post_id VARCHAR(255) NOT NULL,
+            post_id VARCHAR(255) NOT NULL UNIQUE,
             username VARCHAR(255) NOT NULL,
             caption TEXT NOT NULL,
-            timestamp TIMESTAMP NOT NULL,
-            UNIQUE (post_id, user_id)
+            timestamp TIMESTAMP NOT NULL
         );
     """)
 
-    # Create articles table for RSS feed content with user_id
-    # Add user_id and composite unique constraint if not exists
+    # Create articles table for RSS feed content, stored once and shared by all users
     cur.execute("""
         CREATE TABLE IF NOT EXISTS articles (
             id SERIAL PRIMARY KEY,
-            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-            url TEXT NOT NULL,
+            url TEXT NOT NULL UNIQUE,
             headline TEXT NOT NULL,
             source_name VARCHAR(255) NOT NULL,
             summary TEXT,
             published_at TIMESTAMP WITH TIME ZONE,
             created_at TIMESTAMP WITH TIME ZONE DEFAULT (now() at time zone 'utc'),
-            UNIQUE (url, user_id)
+            from_feed BOOLEAN NOT NULL DEFAULT TRUE
+        );
+    """)
+
+    # Create seen_items table holding each user's dedup state over the shared content
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS seen_items (
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            item_type VARCHAR(20) NOT NULL,
+            item_key TEXT NOT NULL,
+            seen_at TIMESTAMP WITH TIME ZONE DEFAULT (now() at time zone 'utc'),
+            PRIMARY KEY (user_id, item_type, item_key)
         );
     """)
 
@@ -73,107 +258,878 @@ def init_db():
             UNIQUE (headline, user_id)
         );
     """)
-    conn.commit()
-    cur.close()
-    conn.close()
+    # Serves each page of a user's saved captions (newest first, id breaking ties) straight from the index
+    cur.execute("CREATE INDEX IF NOT EXISTS captions_user_saved_idx ON captions (user_id, saved_at DESC, id DESC);")
 
-def add_user(username, password_hash):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    try:
+    # Create insta_accounts table caching username -> Instagram user id lookups
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS insta_accounts (
+            username VARCHAR(255) PRIMARY KEY,
+            insta_user_id VARCHAR(255) NOT NULL,
+            resolved_at TIMESTAMP WITH TIME ZONE DEFAULT (now() at time zone 'utc')
+        );
+    """)
+
+    # Create source_state table holding per-source high-water marks and HTTP validators
+    cur.execute(SOURCE_STATE_TABLE_SQL)
+
+    # Create news_results table holding precomputed, ranked and stylized news
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS news_results (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            time_limit INTEGER,
+            payload JSONB NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT (now() at time zone 'utc')
+        );
+    """)
+    # Keyed on COALESCE(time_limit, -1) like ingest_jobs_active_key_idx, so "no time limit" lookups use it too
+    cur.execute("DROP INDEX IF EXISTS news_results_lookup_idx;")
+    cur.execute("CREATE INDEX IF NOT EXISTS news_results_key_idx ON news_results (user_id, COALESCE(time_limit, -1), created_at DESC);")
+
+    # Create ingest_jobs table used as the queue for the background ingestion worker
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_jobs (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            time_limit INTEGER,
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            scheduled BOOLEAN NOT NULL DEFAULT FALSE,
+            result_id INTEGER REFERENCES news_results(id) ON DELETE SET NULL,
+            error TEXT,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT (now() at time zone 'utc'),
+            started_at TIMESTAMP WITH TIME ZONE,
+            finished_at TIMESTAMP WITH TIME ZONE
+        );
+    """)
+    # Scheduled refreshes rank the user's window without marking it seen; only requested runs claim content
+    cur.execute("ALTER TABLE ingest_jobs ADD COLUMN IF NOT EXISTS scheduled BOOLEAN NOT NULL DEFAULT FALSE;")
+    cur.execute("CREATE INDEX IF NOT EXISTS ingest_jobs_pending_idx ON ingest_jobs (created_at) WHERE status = 'pending';")
+    cur.execute("CREATE INDEX IF NOT EXISTS ingest_jobs_key_idx ON ingest_jobs (user_id, COALESCE(time_limit, -1), id DESC);")
+    # At most one pending/running job per (user, time_limit), so simultaneous refreshes share one pipeline run
+    cur.execute("""
+        UPDATE ingest_jobs SET status = 'failed', error = 'Superseded by a newer job.'
+        WHERE status IN ('pending', 'running') AND id NOT IN (
+            SELECT max(id) FROM ingest_jobs WHERE status IN ('pending', 'running')
+            GROUP BY user_id, COALESCE(time_limit, -1)
+        );
+    """)
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS ingest_jobs_active_key_idx ON ingest_jobs (user_id, COALESCE(time_limit, -1))
+        WHERE status IN ('pending', 'running');
+    """)
+
+    # Create news_requests table recording when each (user, time_limit) key was last asked for by the user,
+    # so the ingest worker only keeps refreshing keys someone is actually reading
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS news_requests (
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            time_limit INTEGER,
+            last_requested_at TIMESTAMP WITH TIME ZONE DEFAULT (now() at time zone 'utc')
+        );
+    """)
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS news_requests_key_idx ON news_requests (user_id, COALESCE(time_limit, -1));")
+
+    # Create llm_cache table holding Gemini and stylization outputs keyed by a hash of their inputs
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            cache_key CHAR(64) PRIMARY KEY,
+            kind VARCHAR(40) NOT NULL,
+            value JSONB NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT (now() at time zone 'utc'),
+            last_used_at TIMESTAMP WITH TIME ZONE DEFAULT (now() at time zone 'utc')
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_used_idx ON llm_cache (last_used_at);")
+
+    # Create article_cache table holding extracted article text (shared by all users) keyed by a hash of the normalized URL
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS article_cache (
+            cache_key CHAR(64) PRIMARY KEY,
+            url TEXT NOT NULL,
+            article_text TEXT NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            fetched_at TIMESTAMP WITH TIME ZONE DEFAULT (now() at time zone 'utc'),
+            last_used_at TIMESTAMP WITH TIME ZONE DEFAULT (now() at time zone 'utc')
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS article_cache_last_used_idx ON article_cache (last_used_at);")
+
+    _migrate_to_shared_content(cur)
+    _create_search_columns(cur)
+
+# Weighted text each table is searched by: A for titles, B for body text, C for the poster's handle
+SEARCH_DOCUMENTS = {
+    "captions": [("headline", "A"), ("summary", "B"), ("versus_caption", "B")],
+    "articles": [("headline", "A"), ("summary", "B")],
+    "posts": [("caption", "B"), ("username", "C")],
+}
+
+def _create_search_columns(cur):
+    """Adds a generated, GIN-indexed search_vector column to every searchable table (rewrites each table once)."""
+    for table, fields in SEARCH_DOCUMENTS.items():
+        document = sql.SQL(" || ").join(
+            sql.SQL("setweight(to_tsvector({config}::regconfig, coalesce({field}, '')), {weight})").format(
+                config=sql.Literal(SEARCH_TEXT_CONFIG), field=sql.Identifier(field), weight=sql.Literal(weight)
+            )
+            for field, weight in fields
+        )
+        cur.execute(sql.SQL(
+            "ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ({document}) STORED;"
+        ).format(table=sql.Identifier(table), document=document))
+        cur.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {index} ON {table} USING GIN (search_vector);").format(
+            index=sql.Identifier(f"{table}_search_idx"), table=sql.Identifier(table)
+        ))
+        # Finer lexeme statistics, so the planner can tell rare search terms from common ones
+        cur.execute(sql.SQL("ALTER TABLE {table} ALTER COLUMN search_vector SET STATISTICS 1000;").format(table=sql.Identifier(table)))
+    # Newest-first walks for common search terms (captions use captions_user_saved_idx)
+    cur.execute("CREATE INDEX IF NOT EXISTS articles_recent_idx ON articles ((coalesce(published_at, created_at)) DESC);")
+    cur.execute("CREATE INDEX IF NOT EXISTS posts_recent_idx ON posts (timestamp DESC);")
+
+SOURCE_STATE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS source_state (
+        source_key TEXT PRIMARY KEY,
+        last_item_id TEXT,
+        last_published_at TIMESTAMP WITH TIME ZONE,
+        etag TEXT,
+        last_modified TEXT,
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT (now() at time zone 'utc')
+    );
+"""
+
+def _has_column(cur, table, column):
+    cur.execute(
+        "SELECT 1 FROM information_schema.columns WHERE table_name = %s AND column_name = %s;",
+        (table, column)
+    )
+    return cur.fetchone() is not None
+
+def _migrate_to_shared_content(cur):
+    """
+    Converts databases created with per-user posts/articles into the shared store:
+    existing rows become seen_items, duplicates collapse into one row, and user_id is dropped.
+    """
+    # Articles submitted through /api/process-url are kept out of everyone's ranking input.
+    # Older rows are classified before any duplicates collapse: submitted articles are the
+    # ones stored under their own URL's host as source name.
+    if not _has_column(cur, 'articles', 'from_feed'):
+        print("Marking submitted articles as private...")
+        cur.execute("ALTER TABLE articles ADD COLUMN from_feed BOOLEAN NOT NULL DEFAULT TRUE;")
         cur.execute(
-            "INSERT INTO users (username, password_hash) VALUES (%s, %s) RETURNING id;",
-            (username, password_hash)
+            "UPDATE articles SET from_feed = FALSE WHERE source_name = substring(url from '^[^:]+://([^/?#]+)');"
         )
-        user_id = cur.fetchone()[0]
-        conn.commit()
-        return user_id
-    except errors.UniqueViolation:
-        conn.rollback()
-        return None # User already exists
-    finally:
-        cur.close()
-        conn.close()
+
+    for table, item_type, key_column in (('posts', 'post', 'post_id'), ('articles', 'article', 'url')):
+        if not _has_column(cur, table, 'user_id'):
+            continue
+        print(f"Migrating {table} to the shared content store...")
+        cur.execute(sql.SQL(
+            "INSERT INTO seen_items (user_id, item_type, item_key) SELECT user_id, %s, {key} FROM {table} ON CONFLICT DO NOTHING;"
+        ).format(key=sql.Identifier(key_column), table=sql.Identifier(table)), (item_type,))
+        if table == 'articles':
+            # The surviving copy of a URL is a feed article if any copy of it came from a feed
+            cur.execute(
+                "UPDATE articles a SET from_feed = TRUE FROM articles b WHERE a.url = b.url AND b.from_feed AND NOT a.from_feed;"
+            )
+        cur.execute(sql.SQL(
+            "DELETE FROM {table} a USING {table} b WHERE a.{key} = b.{key} AND a.id > b.id;"
+        ).format(key=sql.Identifier(key_column), table=sql.Identifier(table)))
+        # Dropping the column also drops the old (key, user_id) unique constraint
+        cur.execute(sql.SQL("ALTER TABLE {table} DROP COLUMN user_id;").format(table=sql.Identifier(table)))
+        cur.execute(sql.SQL("ALTER TABLE {table} ADD UNIQUE ({key});").format(
+            key=sql.Identifier(key_column), table=sql.Identifier(table)
+        ))
+
+    # Per-user watermarks are only a fetch optimisation, so they are simply reset
+    if _has_column(cur, 'source_state', 'user_id'):
+        cur.execute("DROP TABLE source_state;")
+        cur.execute(SOURCE_STATE_TABLE_SQL)
+
+def add_user(username, password_hash):
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                "INSERT INTO users (username, password_hash) VALUES (%s, %s) RETURNING id;",
+                (username, password_hash)
+            )
+            user_id = cur.fetchone()[0]
+            conn.commit()
+            return user_id
+        except errors.UniqueViolation:
+            conn.rollback()
+            return None # User already exists
+        finally:
+            cur.close()
 
 def get_user_by_username(username):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT id, username, password_hash FROM users WHERE username = %s;", (username,))
-    user = cur.fetchone()
-    cur.close()
-    conn.close()
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT id, username, password_hash FROM users WHERE username = %s;", (username,))
+        user = cur.fetchone()
+        cur.close()
     return user
 
-def post_exists(post_id, user_id):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT 1 FROM posts WHERE post_id = %s AND user_id = %s;", (post_id, user_id))
-    exists = cur.fetchone() is not None
-    cur.close()
-    conn.close()
+def post_exists(post_id):
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT 1 FROM posts WHERE post_id = %s;", (post_id,))
+        exists = cur.fetchone() is not None
+        cur.close()
     return exists
 
-def add_post(post_id, user_id, username, caption, timestamp):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO posts (post_id, user_id, username, caption, timestamp) VALUES (%s, %s, %s, %s, %s);",
-        (post_id, user_id, username, caption, timestamp)
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
+def add_post(post_id, username, caption, timestamp):
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "INSERT INTO posts (post_id, username, caption, timestamp) VALUES (%s, %s, %s, %s) ON CONFLICT (post_id) DO NOTHING;",
+            (post_id, username, caption, timestamp)
+        )
+        conn.commit()
+        cur.close()
+
+def get_insta_user_ids(usernames):
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT username, insta_user_id FROM insta_accounts WHERE username = ANY(%s);", (list(usernames),))
+        user_ids = dict(cur.fetchall())
+        cur.close()
+    return user_ids
+
+def save_insta_user_id(username, insta_user_id):
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "INSERT INTO insta_accounts (username, insta_user_id) VALUES (%s, %s) "
+            "ON CONFLICT (username) DO UPDATE SET insta_user_id = EXCLUDED.insta_user_id, resolved_at = now() at time zone 'utc';",
+            (username, str(insta_user_id))
+        )
+        conn.commit()
+        cur.close()
+
+def delete_insta_user_id(username):
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM insta_accounts WHERE username = %s;", (username,))
+        conn.commit()
+        cur.close()
+
+def get_source_states(source_keys):
+    """Returns {source_key: state dict} for the sources that have been fetched before."""
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT source_key, last_item_id, last_published_at, etag, last_modified, updated_at FROM source_state WHERE source_key = ANY(%s);",
+            (list(source_keys),)
+        )
+        columns = ['last_item_id', 'last_published_at', 'etag', 'last_modified', 'updated_at']
+        states = {row[0]: dict(zip(columns, row[1:])) for row in cur.fetchall()}
+        cur.close()
+    return states
+
+def save_source_states(states):
+    """Upserts {source_key: state dict} in one round trip."""
+    if not states:
+        return
+    rows = [
+        (source_key, state.get('last_item_id'), state.get('last_published_at'), state.get('etag'), state.get('last_modified'))
+        for source_key, state in states.items()
+    ]
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        execute_values(
+            cur,
+            """
+            INSERT INTO source_state (source_key, last_item_id, last_published_at, etag, last_modified) VALUES %s
+            ON CONFLICT (source_key) DO UPDATE SET
+                last_item_id = EXCLUDED.last_item_id,
+                last_published_at = EXCLUDED.last_published_at,
+                etag = EXCLUDED.etag,
+                last_modified = EXCLUDED.last_modified,
+                updated_at = now() at time zone 'utc';
+            """,
+            rows
+        )
+        conn.commit()
+        cur.close()
+
+def add_new_posts(posts):
+    """Inserts a batch of posts in one transaction and returns only the ones that were not stored yet."""
+    posts = list({post['post_id']: post for post in posts}.values())
+    if not posts:
+        return []
+    rows = [(post['post_id'], post['username'], post['caption'], post['timestamp']) for post in posts]
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        inserted = execute_values(
+            cur,
+            "INSERT INTO posts (post_id, username, caption, timestamp) VALUES %s ON CONFLICT (post_id) DO NOTHING RETURNING post_id;",
+            rows,
+            page_size=len(rows),
+            fetch=True
+        )
+        conn.commit()
+        cur.close()
+    new_post_ids = {row[0] for row in inserted}
+    return [post for post in posts if post['post_id'] in new_post_ids]
 
 def article_exists(url, user_id):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT 1 FROM articles WHERE url = %s AND user_id = %s;", (url, user_id))
-    exists = cur.fetchone() is not None
-    cur.close()
-    conn.close()
+    """True if this user has already seen (processed) the article."""
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT 1 FROM seen_items WHERE user_id = %s AND item_type = 'article' AND item_key = %s;", (user_id, url))
+        exists = cur.fetchone() is not None
+        cur.close()
     return exists
 
+def get_seen_article_urls(user_id, urls):
+    """Returns the subset of urls this user has already seen (processed), in one query."""
+    if not urls:
+        return set()
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT item_key FROM seen_items WHERE user_id = %s AND item_type = 'article' AND item_key = ANY(%s);",
+            (user_id, list(urls))
+        )
+        seen = {row[0] for row in cur.fetchall()}
+        cur.close()
+    return seen
+
 def add_article(url, user_id, headline, source_name, summary, published_at):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO articles (url, user_id, headline, source_name, summary, published_at) VALUES (%s, %s, %s, %s, %s, %s);",
-        (url, user_id, headline, source_name, summary, published_at)
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
+    """Stores the article in the shared store (if new) and marks it as seen by the user."""
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "INSERT INTO articles (url, headline, source_name, summary, published_at, from_feed) VALUES (%s, %s, %s, %s, %s, FALSE) ON CONFLICT (url) DO NOTHING;",
+            (url, headline, source_name, summary, published_at)
+        )
+        cur.execute(
+            "INSERT INTO seen_items (user_id, item_type, item_key) VALUES (%s, 'article', %s) ON CONFLICT DO NOTHING;",
+            (user_id, url)
+        )
+        conn.commit()
+        cur.close()
+
+def add_new_articles(articles):
+    """
+    Inserts a batch of articles in one transaction and returns only the ones that were not stored yet.
+    A URL already stored privately through /api/process-url becomes a feed article, but isn't returned.
+    """
+    articles = list({article['url']: article for article in articles}.values())
+    if not articles:
+        return []
+    rows = [
+        (article['url'], article['headline'], article['source_name'], article['summary'], article['published_at'])
+        for article in articles
+    ]
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        inserted = execute_values(
+            cur,
+            "INSERT INTO articles (url, headline, source_name, summary, published_at) VALUES %s "
+            "ON CONFLICT (url) DO UPDATE SET from_feed = TRUE WHERE NOT articles.from_feed "
+            "RETURNING url, xmax = 0;",
+            rows,
+            page_size=len(rows),
+            fetch=True
+        )
+        conn.commit()
+        cur.close()
+    new_urls = {url for url, is_insert in inserted if is_insert}
+    return [article for article in articles if article['url'] in new_urls]
+
+def claim_unseen_content(user_id, min_timestamp=None, limit=200, claim=True):
+    """
+    Returns the newest shared posts and articles this user hasn't seen yet (optionally
+    only those newer than min_timestamp) and, unless claim is False, marks them as seen
+    in the same transaction.
+    """
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT p.post_id, p.username, p.caption FROM posts p
+            WHERE (%(since)s::timestamptz IS NULL OR p.timestamp >= %(since)s)
+            AND NOT EXISTS (
+                SELECT 1 FROM seen_items s
+                WHERE s.user_id = %(user_id)s AND s.item_type = 'post' AND s.item_key = p.post_id
+            )
+            ORDER BY p.timestamp DESC LIMIT %(limit)s;
+        """, {"since": min_timestamp, "user_id": user_id, "limit": limit})
+        posts = [dict(zip(['post_id', 'username', 'caption'], row)) for row in cur.fetchall()]
+
+        cur.execute("""
+            SELECT a.url, a.headline, a.source_name, a.summary FROM articles a
+            WHERE a.from_feed
+            -- Feed items without a parseable pubDate are stored undated; they count from when they were fetched
+            AND (%(since)s::timestamptz IS NULL OR coalesce(a.published_at, a.created_at) >= %(since)s)
+            AND NOT EXISTS (
+                SELECT 1 FROM seen_items s
+                WHERE s.user_id = %(user_id)s AND s.item_type = 'article' AND s.item_key = a.url
+            )
+            ORDER BY coalesce(a.published_at, a.created_at) DESC LIMIT %(limit)s;
+        """, {"since": min_timestamp, "user_id": user_id, "limit": limit})
+        articles = [dict(zip(['url', 'headline', 'source_name', 'summary'], row)) for row in cur.fetchall()]
+
+        seen_rows = [(user_id, 'post', post['post_id']) for post in posts]
+        seen_rows += [(user_id, 'article', article['url']) for article in articles]
+        if claim and seen_rows:
+            execute_values(
+                cur,
+                "INSERT INTO seen_items (user_id, item_type, item_key) VALUES %s ON CONFLICT DO NOTHING;",
+                seen_rows
+            )
+        conn.commit()
+        cur.close()
+    return posts, articles
 
 def save_caption(user_id, headline, summary, source_caption, versus_caption):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    try:
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                "INSERT INTO captions (user_id, headline, summary, source_caption, versus_caption) VALUES (%s, %s, %s, %s, %s);",
+                (user_id, headline, summary, source_caption, versus_caption)
+            )
+            conn.commit()
+            return True
+        except errors.UniqueViolation:
+            conn.rollback()
+            return False # Caption already exists for this user
+        finally:
+            cur.close()
+
+def get_saved_captions(user_id, limit=CAPTIONS_PAGE_SIZE, before=None):
+    """
+    One page of a user's saved captions, newest first, as list rows:
+    (id, headline, summary preview, summary_truncated, versus_caption, saved_at).
+    before is the (saved_at, id) of the last row of the previous page (keyset
+    pagination). Returns (rows, has_more).
+    """
+    query = """
+        SELECT id, headline, left(summary, %s), length(summary) > %s, versus_caption, saved_at
+        FROM captions WHERE user_id = %s {before}
+        ORDER BY saved_at DESC, id DESC LIMIT %s;
+    """
+    params = [CAPTION_PREVIEW_CHARS, CAPTION_PREVIEW_CHARS, user_id]
+    if before is not None:
+        query = query.format(before="AND (saved_at, id) < (%s, %s)")
+        params += list(before)
+    else:
+        query = query.format(before="")
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(query, params + [limit + 1]) # One extra row tells whether another page exists
+        rows = cur.fetchall()
+        cur.close()
+    return rows[:limit], len(rows) > limit
+
+def get_saved_caption(caption_id, user_id):
+    """Returns one saved caption with its full text: (id, headline, summary, source_caption, versus_caption, saved_at), or None."""
+    with get_db_connection() as conn:
+        cur = conn.cursor()
         cur.execute(
-            "INSERT INTO captions (user_id, headline, summary, source_caption, versus_caption) VALUES (%s, %s, %s, %s, %s);",
-            (user_id, headline, summary, source_caption, versus_caption)
+            "SELECT id, headline, summary, source_caption, versus_caption, saved_at FROM captions WHERE id = %s AND user_id = %s;",
+            (caption_id, user_id)
         )
+        caption = cur.fetchone()
+        cur.close()
+    return caption
+
+def delete_caption(caption_id, user_id):
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM captions WHERE id = %s AND user_id = %s;", (caption_id, user_id))
         conn.commit()
-        return True
-    except errors.UniqueViolation:
-        conn.rollback()
-        return False # Caption already exists for this user
-    finally:
         cur.close()
-        conn.close()
 
-def get_saved_captions(user_id):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT id, headline, summary, source_caption, versus_caption, saved_at FROM captions WHERE user_id = %s ORDER BY saved_at DESC;", (user_id,))
-    captions = cur.fetchall()
-    cur.close()
-    conn.close()
-    return captions
+def save_news_result(user_id, time_limit, payload):
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "INSERT INTO news_results (user_id, time_limit, payload) VALUES (%s, %s, %s) RETURNING id;",
+            (user_id, time_limit, Json(payload))
+        )
+        result_id = cur.fetchone()[0]
+        conn.commit()
+        cur.close()
+    return result_id
 
-def delete_caption(caption_id, user_id):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM captions WHERE id = %s AND user_id = %s;", (caption_id, user_id))
-    conn.commit()
-    cur.close()
-    conn.close()
+def get_latest_news_result(user_id, time_limit):
+    """Returns (result_id, payload, created_at) for the newest precomputed result, or None."""
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT id, payload, created_at FROM news_results WHERE user_id = %s AND COALESCE(time_limit, -1) = COALESCE(%s::integer, -1) ORDER BY created_at DESC LIMIT 1;",
+            (user_id, time_limit)
+        )
+        result = cur.fetchone()
+        cur.close()
+    return result
+
+def get_news_result(result_id):
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT payload FROM news_results WHERE id = %s;", (result_id,))
+        row = cur.fetchone()
+        cur.close()
+    return row[0] if row else None
+
+def prune_news_history(user_id, time_limit, keep):
+    """
+    Deletes all but the newest `keep` results and finished jobs of one (user, time_limit) key.
+    A job's result is never older than the job, so the kept jobs keep their results.
+    Returns (results removed, jobs removed).
+    """
+    keep = max(keep, 1) # The latest result is what /api/breaking-news serves
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            DELETE FROM news_results WHERE user_id = %(user_id)s AND COALESCE(time_limit, -1) = COALESCE(%(time_limit)s::integer, -1)
+            AND id NOT IN (
+                SELECT id FROM news_results WHERE user_id = %(user_id)s AND COALESCE(time_limit, -1) = COALESCE(%(time_limit)s::integer, -1)
+                ORDER BY created_at DESC LIMIT %(keep)s
+            );
+        """, {"user_id": user_id, "time_limit": time_limit, "keep": keep})
+        results_removed = cur.rowcount
+        cur.execute("""
+            DELETE FROM ingest_jobs WHERE user_id = %(user_id)s AND COALESCE(time_limit, -1) = COALESCE(%(time_limit)s::integer, -1)
+            AND status IN ('done', 'failed', 'halted') AND id NOT IN (
+                SELECT id FROM ingest_jobs WHERE user_id = %(user_id)s AND COALESCE(time_limit, -1) = COALESCE(%(time_limit)s::integer, -1)
+                AND status IN ('done', 'failed', 'halted') ORDER BY id DESC LIMIT %(keep)s
+            );
+        """, {"user_id": user_id, "time_limit": time_limit, "keep": keep})
+        jobs_removed = cur.rowcount
+        conn.commit()
+        cur.close()
+    return results_removed, jobs_removed
+
+def enqueue_ingest_job(user_id, time_limit, scheduled=False):
+    """
+    Queues a pipeline run, or returns the id of the one already pending/running for the same key.
+    A requested run joining a pending scheduled one turns it into a requested run, so it claims what it ranks.
+    """
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        job_id = None
+        # Retry once in case the active job finished between the insert and the lookup
+        for _ in range(2):
+            cur.execute("""
+                INSERT INTO ingest_jobs (user_id, time_limit, scheduled) VALUES (%s, %s, %s)
+                ON CONFLICT (user_id, COALESCE(time_limit, -1)) WHERE status IN ('pending', 'running') DO NOTHING
+                RETURNING id;
+            """, (user_id, time_limit, scheduled))
+            row = cur.fetchone()
+            if row is None:
+                cur.execute("""
+                    UPDATE ingest_jobs SET scheduled = scheduled AND (status = 'running' OR %s)
+                    WHERE user_id = %s AND COALESCE(time_limit, -1) = COALESCE(%s::integer, -1) AND status IN ('pending', 'running')
+                    RETURNING id;
+                """, (scheduled, user_id, time_limit))
+                row = cur.fetchone()
+            if row is not None:
+                job_id = row[0]
+                break
+        conn.commit()
+        cur.close()
+    return job_id
+
+def claim_next_ingest_job():
+    """Atomically marks the oldest pending job as running and returns (job_id, user_id, time_limit, scheduled), or None."""
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE ingest_jobs SET status = 'running', started_at = now() at time zone 'utc'
+            WHERE id = (
+                SELECT id FROM ingest_jobs WHERE status = 'pending'
+                ORDER BY created_at FOR UPDATE SKIP LOCKED LIMIT 1
+            )
+            RETURNING id, user_id, time_limit, scheduled;
+        """)
+        job = cur.fetchone()
+        conn.commit()
+        cur.close()
+    return job
+
+def finish_ingest_job(job_id, status, result_id=None, error=None):
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "UPDATE ingest_jobs SET status = %s, result_id = %s, error = %s, finished_at = now() at time zone 'utc' WHERE id = %s;",
+            (status, result_id, error, job_id)
+        )
+        conn.commit()
+        cur.close()
+
+def cancel_ingest_jobs(user_id, job_id=None):
+    """
+    Cancels the user's job (or all of their active jobs when job_id is None). Pending jobs are
+    halted outright; running ones move to 'cancelling' until their worker notices and stops.
+    Returns the ids of the jobs that were cancelled.
+    """
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE ingest_jobs SET
+                status = CASE WHEN status = 'pending' THEN 'halted' ELSE 'cancelling' END,
+                finished_at = CASE WHEN status = 'pending' THEN now() at time zone 'utc' ELSE finished_at END
+            WHERE user_id = %s AND (%s::integer IS NULL OR id = %s) AND status IN ('pending', 'running')
+            RETURNING id;
+        """, (user_id, job_id, job_id))
+        cancelled = [row[0] for row in cur.fetchall()]
+        conn.commit()
+        cur.close()
+    return cancelled
+
+def is_ingest_job_cancelled(job_id):
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT status FROM ingest_jobs WHERE id = %s;", (job_id,))
+        row = cur.fetchone()
+        cur.close()
+    return row is not None and row[0] in ('cancelling', 'halted')
+
+def get_ingest_job(job_id, user_id):
+    """Returns the job as a dict (with its result payload once done), or None if it doesn't belong to the user."""
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT j.id, j.status, j.time_limit, j.error, j.created_at, j.finished_at, r.payload
+            FROM ingest_jobs j LEFT JOIN news_results r ON r.id = j.result_id
+            WHERE j.id = %s AND j.user_id = %s;
+        """, (job_id, user_id))
+        row = cur.fetchone()
+        cur.close()
+    if row is None:
+        return None
+    columns = ['job_id', 'status', 'time_limit', 'error', 'created_at', 'finished_at', 'result']
+    return dict(zip(columns, row))
+
+def record_news_request(user_id, time_limit):
+    """Marks the (user, time_limit) key as just requested by the user, keeping its scheduled refreshes alive."""
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO news_requests (user_id, time_limit) VALUES (%s, %s)
+            ON CONFLICT (user_id, COALESCE(time_limit, -1)) DO UPDATE SET last_requested_at = now() at time zone 'utc';
+        """, (user_id, time_limit))
+        conn.commit()
+        cur.close()
+
+def get_scheduled_ingest_targets(active_hours):
+    """
+    Returns (user_id, time_limit) pairs the user requested within the last `active_hours`
+    that have no job pending or running, for the worker's periodic refresh. Jobs the
+    scheduler queues itself don't count as requests, so refreshes stop once a key goes unread.
+    """
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT r.user_id, r.time_limit FROM news_requests r
+            WHERE r.last_requested_at > (now() at time zone 'utc') - make_interval(hours => %s)
+            AND NOT EXISTS (
+                SELECT 1 FROM ingest_jobs p
+                WHERE p.user_id = r.user_id AND COALESCE(p.time_limit, -1) = COALESCE(r.time_limit, -1)
+                AND p.status IN ('pending', 'running')
+            );
+        """, (active_hours,))
+        targets = cur.fetchall()
+        cur.close()
+    return targets
+
+def fail_stale_ingest_jobs(max_runtime_minutes):
+    """Marks jobs left running (or cancelling) by a crashed worker as finished so their keys can be refreshed again."""
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE ingest_jobs SET
+                status = CASE WHEN status = 'cancelling' THEN 'halted' ELSE 'failed' END,
+                error = CASE WHEN status = 'cancelling' THEN NULL ELSE 'Worker stopped before the job finished.' END,
+                finished_at = now() at time zone 'utc'
+            WHERE status IN ('running', 'cancelling') AND started_at < (now() at time zone 'utc') - make_interval(mins => %s);
+        """, (max_runtime_minutes,))
+        failed = cur.rowcount
+        conn.commit()
+        cur.close()
+    return failed
+
+def get_llm_cache_entries(cache_keys, ttl_hours):
+    """Returns {cache_key: value} for unexpired entries and bumps their last-used time for LRU eviction."""
+    if not cache_keys:
+        return {}
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE llm_cache SET last_used_at = now() at time zone 'utc'
+            WHERE cache_key = ANY(%s) AND created_at > (now() at time zone 'utc') - make_interval(hours => %s)
+            RETURNING cache_key, value;
+        """, (list(cache_keys), ttl_hours))
+        entries = dict(cur.fetchall())
+        conn.commit()
+        cur.close()
+    return entries
+
+def set_llm_cache_entries(entries):
+    """Upserts [(cache_key, kind, value)] in one round trip."""
+    if not entries:
+        return
+    rows = [(cache_key, kind, Json(value)) for cache_key, kind, value in entries]
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        execute_values(
+            cur,
+            """
+            INSERT INTO llm_cache (cache_key, kind, value) VALUES %s
+            ON CONFLICT (cache_key) DO UPDATE SET
+                value = EXCLUDED.value,
+                created_at = now() at time zone 'utc',
+                last_used_at = now() at time zone 'utc';
+            """,
+            rows
+        )
+        conn.commit()
+        cur.close()
+
+def evict_llm_cache(ttl_hours, max_entries):
+    """Drops expired entries, then the least recently used ones beyond max_entries. Returns the number removed."""
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "DELETE FROM llm_cache WHERE created_at <= (now() at time zone 'utc') - make_interval(hours => %s);",
+            (ttl_hours,)
+        )
+        removed = cur.rowcount
+        cur.execute("""
+            DELETE FROM llm_cache WHERE cache_key IN (
+                SELECT cache_key FROM llm_cache ORDER BY last_used_at DESC OFFSET %s
+            );
+        """, (max_entries,))
+        removed += cur.rowcount
+        conn.commit()
+        cur.close()
+    return removed
+
+
+def get_article_cache_entries(cache_keys):
+    """Returns {cache_key: entry} for cached article text and bumps their last-used time for LRU eviction."""
+    if not cache_keys:
+        return {}
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE article_cache SET last_used_at = now() at time zone 'utc'
+            WHERE cache_key = ANY(%s)
+            RETURNING cache_key, article_text, etag, last_modified, fetched_at;
+        """, (list(cache_keys),))
+        entries = {
+            row[0]: {"text": row[1], "etag": row[2], "last_modified": row[3], "fetched_at": row[4]}
+            for row in cur.fetchall()
+        }
+        conn.commit()
+        cur.close()
+    return entries
+
+def set_article_cache_entry(cache_key, url, article_text, etag, last_modified):
+    """Upserts one extracted article with the validators of the response it came from."""
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO article_cache (cache_key, url, article_text, etag, last_modified) VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (cache_key) DO UPDATE SET
+                article_text = EXCLUDED.article_text,
+                etag = EXCLUDED.etag,
+                last_modified = EXCLUDED.last_modified,
+                fetched_at = now() at time zone 'utc',
+                last_used_at = now() at time zone 'utc';
+        """, (cache_key, url, article_text, etag, last_modified))
+        conn.commit()
+        cur.close()
+
+def touch_article_cache_entry(cache_key):
+    """Marks a cached article as just revalidated (the site answered 304 Not Modified)."""
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "UPDATE article_cache SET fetched_at = now() at time zone 'utc' WHERE cache_key = %s;",
+            (cache_key,)
+        )
+        conn.commit()
+        cur.close()
+
+def evict_article_cache(max_entries):
+    """Drops the least recently used cached articles beyond max_entries. Returns the number removed."""
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            DELETE FROM article_cache WHERE cache_key IN (
+                SELECT cache_key FROM article_cache ORDER BY last_used_at DESC OFFSET %s
+            );
+        """, (max_entries,))
+        removed = cur.rowcount
+        conn.commit()
+        cur.close()
+    return removed
+
+# Each branch ranks only its type's SEARCH_MAX_CANDIDATES newest matches, so a common term costs the same at any
+# table size. The tsquery is spelled out in every clause (not shared through a CTE) so the planner sees it as a
+# constant and can estimate how many rows match: rare terms use the GIN index, common ones walk the recency index.
+SEARCH_TSQUERY = "websearch_to_tsquery(%(config)s::regconfig, %(text)s)"
+SEARCH_BRANCHES = {
+    "caption": """
+        SELECT 'caption' AS type, c.id, c.headline AS title, c.summary AS body, c.saved_at AS at, ts_rank(c.search_vector, {tsquery}) AS rank
+        FROM (SELECT id FROM captions WHERE user_id = %(user_id)s AND search_vector @@ {tsquery}
+              ORDER BY saved_at DESC LIMIT %(candidates)s) hit
+        JOIN captions c USING (id)
+    """,
+    "article": """
+        SELECT 'article' AS type, a.id, a.headline AS title, a.summary AS body, coalesce(a.published_at, a.created_at) AS at, ts_rank(a.search_vector, {tsquery}) AS rank
+        FROM (SELECT id FROM articles a WHERE search_vector @@ {tsquery}
+              -- URLs other users submitted through /api/process-url stay private to them
+              AND (a.from_feed OR EXISTS (
+                  SELECT 1 FROM seen_items s WHERE s.user_id = %(user_id)s AND s.item_type = 'article' AND s.item_key = a.url
+              ))
+              ORDER BY coalesce(published_at, created_at) DESC LIMIT %(candidates)s) hit
+        JOIN articles a USING (id)
+    """,
+    "post": """
+        SELECT 'post' AS type, p.id, '@' || p.username AS title, p.caption AS body, p.timestamp AT TIME ZONE 'UTC' AS at, ts_rank(p.search_vector, {tsquery}) AS rank
+        FROM (SELECT id FROM posts WHERE search_vector @@ {tsquery}
+              ORDER BY timestamp DESC LIMIT %(candidates)s) hit
+        JOIN posts p USING (id)
+    """,
+}
+
+def highlight_snippet(snippet):
+    """Escapes a ts_headline snippet for HTML, then turns its match sentinels into <mark></mark>."""
+    return html.escape(snippet).replace(SEARCH_MATCH_START, "<mark>").replace(SEARCH_MATCH_STOP, "</mark>")
+
+def search_content(user_id, text, types=tuple(SEARCH_BRANCHES), limit=20, offset=0):
+    """
+    Full-text search over the user's saved captions, the shared posts and feed articles, and
+    the articles the user submitted.
+    text uses web search syntax ("quoted phrases", -excluded, or). Returns (rows, has_more),
+    rows being (type, id, title, highlighted snippet, date, rank), best match first.
+    Snippets are HTML-escaped (RSS descriptions carry third-party markup) with matches in <mark></mark>.
+    """
+    branches = " UNION ALL ".join(f"({SEARCH_BRANCHES[item_type].format(tsquery=SEARCH_TSQUERY)})" for item_type in types)
+    # Highlighting re-parses each document, so it runs on the returned page only
+    query = f"""
+        SELECT type, id, title, ts_headline(%(config)s::regconfig, coalesce(body, ''), {SEARCH_TSQUERY}, %(options)s), at, rank
+        FROM (
+            SELECT * FROM ({branches}) hits
+            ORDER BY rank DESC, at DESC NULLS LAST, id DESC LIMIT %(limit)s OFFSET %(offset)s
+        ) page
+        ORDER BY rank DESC, at DESC NULLS LAST, id DESC;
+    """
+    params = {
+        "config": SEARCH_TEXT_CONFIG, "text": text, "options": SEARCH_HEADLINE_OPTIONS, "user_id": user_id,
+        "candidates": SEARCH_MAX_CANDIDATES, "limit": limit + 1, "offset": offset, # One extra row tells whether another page exists
+    }
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(query, params)
+        rows = cur.fetchall()
+        cur.close()
+    rows = [(item_type, item_id, title, highlight_snippet(snippet), at, rank) for item_type, item_id, title, snippet, at, rank in rows]
+    return rows[:limit], len(rows) > limit
@@ -1,7 +1,7 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { Button } from "@/components/ui/button";
 import { Card, CardContent, CardFooter, CardHeader, CardTitle } from "@/components/ui/card";
-import { Play, Save, Trash2, StopCircle } from 'lucide-react';
+import { Play, Save, Trash2, StopCircle, RefreshCw } from 'lucide-react';
 import { useToast } from "@/hooks/use-toast";
 import { Skeleton } from "@/components/ui/skeleton";
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from "@/components/ui/select";
@@ -23,6 +23,8 @@ function App() {
   const [urlLoading, setUrlLoading] = useState(false);
   const [urlError, setUrlError] = useState(null);
   const [timeLimit, setTimeLimit] = useState('24'); // Default to 24 hours
+  const [streamingHeadline, setStreamingHeadline] = useState(null);
+  const currentJobId = useRef(null); // Ingest job being waited on, so Halt can cancel exactly that run
 
   const { toast } = useToast();
 
@@ -41,32 +43,62 @@ function App() {
     setNews(savedNews ? JSON.parse(savedNews) : []);
   }, [token]);
 
-  const fetchNews = async () => {
+  const applyNewsPayload = (data) => {
+    if (data.message && data.message.includes("halted")) {
+      toast({ title: "Process Halted", description: data.message, variant: "default" });
+    } else {
+      setNews(data.posts || []);
+    }
+  };
+
+  // Polls a queued ingest job until the background worker finishes it
+  const waitForJob = async (jobId) => {
+    while (true) {
+      await new Promise(resolve => setTimeout(resolve, 2000));
+      const response = await fetch(`/api/jobs/${jobId}`, { headers: authHeaders });
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+      const job = await response.json();
+      if (job.status === 'done') {
+        return job.result;
+      }
+      if (job.status === 'halted') {
+        return { message: "Process halted by user." };
+      }
+      if (job.status === 'failed') {
+        throw new Error(job.error || "Ingest job failed.");
+      }
+    }
+  };
+
+  const fetchNews = async (forceRefresh = false) => {
     setLoading(true);
     setError(null);
     // Do not clear news here, it will be handled by the useEffect on token change
 
     console.log("Fetching news...");
-    console.log("Token:", token);
-    console.log("Auth Headers:", authHeaders);
 
     try {
-      const response = await fetch(`/api/breaking-news?time_limit=${timeLimit}`, {
+      const refreshParam = forceRefresh ? '&refresh=1' : '';
+      const response = await fetch(`/api/breaking-news?time_limit=${timeLimit}${refreshParam}`, {
         headers: authHeaders,
       });
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
       const data = await response.json();
-      if (data.message && data.message.includes("halted")) {
-        toast({ title: "Process Halted", description: data.message, variant: "default" });
+      if (response.status === 202) {
+        currentJobId.current = data.job_id;
+        applyNewsPayload(await waitForJob(data.job_id));
       } else {
-        setNews(data.posts || []);
+        applyNewsPayload(data);
       }
     } catch (e) {
       setError(e.message);
       toast({ title: "Error fetching news", description: e.message, variant: "destructive" });
     } finally {
+      currentJobId.current = null;
       setLoading(false);
     }
   };
@@ -80,6 +112,12 @@ function App() {
     console.log("Token:", token);
     console.log("Auth Headers:", authHeaders);
 
+    const urls = url.split(/\s+/).filter(Boolean);
+    if (urls.length > 1) {
+      await processUrls(urls);
+      return;
+    }
+
     try {
       const response = await fetch('/api/process-url', {
         method: 'POST',
@@ -113,6 +151,59 @@ function App() {
     }
   };
 
+  // Processes several pasted URLs at once, adding each article as the server streams it back
+  const processUrls = async (urls) => {
+    const failed = [];
+    let added = 0;
+    try {
+      const response = await fetch('/api/process-urls', {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          ...authHeaders,
+        },
+        body: JSON.stringify({ urls }),
+      });
+      if (!response.ok) {
+        const result = await response.json();
+        throw new Error(result.error || `HTTP error! status: ${response.status}`);
+      }
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        for (const line of lines) {
+          if (!line.trim()) continue;
+          const result = JSON.parse(line);
+          if (result.status === 'done') {
+            const { url: _url, status: _status, ...item } = result;
+            setNews(prevNews => [item, ...prevNews]);
+            added += 1;
+          } else if (result.status === 'error') {
+            failed.push(result.url);
+          }
+        }
+      }
+
+      setUrl(failed.join(' '));
+      if (failed.length) {
+        setUrlError(`${failed.length} of ${urls.length} URLs could not be processed.`);
+      }
+      toast({ title: "URLs Processed", description: `Added ${added} of ${urls.length} articles.` });
+    } catch (e) {
+      setUrlError(e.message);
+      toast({ title: "Error processing URLs", description: e.message, variant: "destructive" });
+    } finally {
+      setUrlLoading(false);
+    }
+  };
+
   const handleSave = async (itemToSave) => {
     console.log("Saving item...");
     console.log("Token:", token);
@@ -140,6 +231,54 @@ function App() {
     }
   };
 
+  const updateCaption = (headline, update) => {
+    setNews(prevNews => prevNews.map(item =>
+      item.headline === headline ? { ...item, versus_caption: update(item.versus_caption) } : item
+    ));
+  };
+
+  // Regenerates a caption, showing tokens as the inference server streams them
+  const handleRegenerate = async (itemToStyle) => {
+    setStreamingHeadline(itemToStyle.headline);
+    updateCaption(itemToStyle.headline, () => '');
+    try {
+      const response = await fetch('/api/stylize-stream', {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          ...authHeaders,
+        },
+        body: JSON.stringify({ summary: itemToStyle.summary }),
+      });
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const event of events) {
+          if (!event.startsWith('data: ')) continue;
+          const data = JSON.parse(event.slice(6));
+          if (data.error) throw new Error(data.error);
+          if (data.token) updateCaption(itemToStyle.headline, caption => caption + data.token);
+          if (data.done) updateCaption(itemToStyle.headline, () => data.stylized_caption);
+        }
+      }
+    } catch (e) {
+      updateCaption(itemToStyle.headline, () => itemToStyle.versus_caption);
+      toast({ title: "Error generating caption", description: e.message, variant: "destructive" });
+    } finally {
+      setStreamingHeadline(null);
+    }
+  };
+
   const handleTrash = (itemToTrash) => {
     // Just remove the item from the view
     setNews(prevNews => prevNews.filter(item => item.headline !== itemToTrash.headline));
@@ -153,7 +292,8 @@ function App() {
     try {
       const response = await fetch('/api/halt-loop', {
         method: 'POST',
-        headers: authHeaders,
+        headers: { 'Content-Type': 'application/json', ...authHeaders },
+        body: JSON.stringify(currentJobId.current ? { job_id: currentJobId.current } : {}),
       });
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`);
@@ -196,10 +336,16 @@ function App() {
     <div>
       <h1 className="text-3xl font-bold mb-6">The Versus Project</h1>
       <div className="flex space-x-8 mb-8">
-        <Button onClick={fetchNews} disabled={loading} className="flex w-[30%] space-x-[0.5rem] font-bold h-auto items-center">
+        <Button onClick={() => fetchNews()} disabled={loading} className="flex w-[30%] space-x-[0.5rem] font-bold h-auto items-center">
           <Play className="h-4 w-4" />
           <div>{loading ? 'Running...' : 'Run the Main Loop'}</div>
         </Button>
+        {!loading && (
+          <Button onClick={() => fetchNews(true)} variant="outline" className="flex space-x-[0.5rem] font-bold h-auto items-center text-black">
+            <RefreshCw className="h-4 w-4" />
+            <div>Force Refresh</div>
+          </Button>
+        )}
         {loading && (
           <Button onClick={handleHalt} variant="destructive" className="flex space-x-[0.5rem] font-bold h-auto items-center">
             <StopCircle className="h-4 w-4" />
@@ -209,10 +355,10 @@ function App() {
         <div className=' flex items-center text-xl'>//</div>
         <form onSubmit={handleUrlSubmit} className="flex items-center space-x-2 flex-grow bg-gray-800 p-2 rounded-md">
           <input
-            type="url"
+            type="text"
             value={url}
             onChange={(e) => setUrl(e.target.value)}
-            placeholder="Paste an article URL to process..."
+            placeholder="Paste one or more article URLs to process..."
             className="bg-gray-800 text-white w-full p-2 rounded-md focus:outline-none focus:ring-2 focus:ring-indigo-500"
             required
           />
@@ -257,6 +403,9 @@ function App() {
             </CardContent>
             </div>
             <CardFooter className="flex justify-end space-x-2">
+              <Button variant="outline" size="icon" onClick={() => handleRegenerate(item)} disabled={streamingHeadline !== null} className="text-black border-0">
+                <RefreshCw className={`h-4 w-4 ${streamingHeadline === item.headline ? 'animate-spin' : ''}`} />
+              </Button>
               <Button variant="outline" size="icon" onClick={() => handleSave(item)} disabled={item.saved} className="text-black bg-green-100 hover:bg-green-300 border-0">
                 <Save className="h-4 w-4" />
               </Button>
@@ -7,6 +7,8 @@ import { useToast } from "@/hooks/use-toast";
 
 function SavedCaptions() {
   const [savedNews, setSavedNews] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [expanded, setExpanded] = useState({}); // caption id -> full caption, fetched on expand
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
 
@@ -14,17 +16,20 @@ function SavedCaptions() {
   const { toast } = useToast();
   const authHeaders = token ? { 'Authorization': `Bearer ${token}` } : {};
 
-  const fetchSavedNews = async () => {
+  // Loads the first page, or the page after `cursor`
+  const fetchSavedNews = async (cursor = null) => {
     setLoading(true);
     try {
-      const response = await fetch('/api/captions', {
+      const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+      const response = await fetch(`/api/captions${query}`, {
         headers: authHeaders,
       });
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
       const data = await response.json();
-      setSavedNews(data);
+      setSavedNews(prevNews => cursor ? [...prevNews, ...data.captions] : data.captions);
+      setNextCursor(data.next_cursor);
     } catch (e) {
       setError(e.message);
     } finally {
@@ -38,6 +43,25 @@ function SavedCaptions() {
     }
   }, [token]); // Re-fetch when token changes
 
+  const handleToggle = async (captionId) => {
+    if (expanded[captionId]) {
+      setExpanded(({ [captionId]: _, ...rest }) => rest);
+      return;
+    }
+    try {
+      const response = await fetch(`/api/captions/${captionId}`, {
+        headers: authHeaders,
+      });
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+      const caption = await response.json();
+      setExpanded(prev => ({ ...prev, [captionId]: caption }));
+    } catch (e) {
+      toast({ title: "Error loading caption", description: e.message, variant: "destructive" });
+    }
+  };
+
   const handleDelete = async (captionId) => {
     try {
       const response = await fetch(`/api/captions/${captionId}`, {
@@ -61,15 +85,17 @@ function SavedCaptions() {
       {loading && <p className="text-center">Loading...</p>}
       {error && <p className="text-red-500 text-center">Error: {error}</p>}
       <div className="grid grid-cols-1 md:grid-cols-2 gap-6">
-        {savedNews.map((item) => (
+        {savedNews.map((item) => {
+          const full = expanded[item.id];
+          return (
           <Card key={item.id} className="bg-gray-800 border-gray-700 text-white flex flex-col justify-between">
             <div>
               <CardHeader>
                 <CardTitle>{item.headline}</CardTitle>
               </CardHeader>
               <CardContent>
-                <p className="text-gray-400 mb-4">{item.summary}</p>
-                <p className="text-xs text-gray-500 italic mb-4 truncate">Source: {item.source_caption}</p>
+                <p className="text-gray-400 mb-4">{full ? full.summary : item.summary + (item.summary_truncated ? '…' : '')}</p>
+                {full && <p className="text-xs text-gray-500 italic mb-4">Source: {full.source_caption}</p>}
                 <div className="border-t border-gray-700 pt-4">
                   <p className="text-md font-semibold text-teal-400">Versus Caption:</p>
                   <p className="text-gray-300">{item.versus_caption}</p>
@@ -78,13 +104,24 @@ function SavedCaptions() {
             </div>
             <CardFooter className="flex justify-between items-center">
               <p className="text-xs text-gray-500">Saved: {new Date(item.saved_at).toLocaleString()}</p>
-              <Button variant="destructive" size="icon" onClick={() => handleDelete(item.id)}>
-                <Trash2 className="h-4 w-4" />
-              </Button>
+              <div className="flex space-x-2">
+                <Button variant="outline" size="sm" onClick={() => handleToggle(item.id)}>
+                  {full ? 'Show less' : 'Show full text'}
+                </Button>
+                <Button variant="destructive" size="icon" onClick={() => handleDelete(item.id)}>
+                  <Trash2 className="h-4 w-4" />
+                </Button>
+              </div>
             </CardFooter>
           </Card>
-        ))}
+          );
+        })}
       </div>
+      {nextCursor && !loading && (
+        <div className="flex justify-center mt-6">
+          <Button onClick={() => fetchSavedNews(nextCursor)}>Load more</Button>
+        </div>
+      )}
     </div>
   );
 }
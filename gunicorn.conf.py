@@ -0,0 +1,44 @@
+import os
+import tempfile
+import multiprocessing
+
+# --- Gunicorn Configuration (gunicorn -c gunicorn.conf.py wsgi:app) ---
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("WEB_CONCURRENCY", min(multiprocessing.cpu_count() * 2 + 1, 8)))
+# Routes block on Postgres, Gemini and the inference server, so each worker serves requests on a thread pool.
+# Slow pipelines run in ingest_worker.py; web threads only wait on /api/process-url and stylize streams.
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 16))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 180)) # /api/process-url waits on Gemini and the inference server
+graceful_timeout = 30
+keepalive = 5
+# Import the app once in the master and fork workers from it. Gemini and other clients are built lazily
+# in each worker on first use.
+preload_app = True
+accesslog = "-"
+# Each worker keeps its own metrics registry; workers write them to a shared directory so /api/metrics reports
+# totals for all of them, whichever worker answers the scrape. Set before the app (and metrics.py) is imported.
+os.environ.setdefault("METRICS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "versus-metrics"))
+
+def on_starting(server):
+    # The schema is applied once, in the master, instead of racing in every worker (when AUTO_MIGRATE=1)
+    from app_ig import migrate_on_startup
+    migrate_on_startup()
+    # Counters restart with the server, so totals left by a previous run are dropped
+    from metrics import clear_snapshots
+    clear_snapshots()
+
+def when_ready(server):
+    # Workers are forked after this; each opens its own connection pool on first use
+    from database import close_db_pool
+    close_db_pool()
+
+def post_fork(server, worker):
+    # Threads don't survive fork, so each worker starts its own snapshot writer
+    from metrics import start_snapshot_writer
+    start_snapshot_writer()
+
+def worker_exit(server, worker):
+    # Keep the counts of the requests this worker served since its last snapshot
+    from metrics import write_snapshot
+    write_snapshot()
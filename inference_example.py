@@ -1,12 +1,15 @@
 # --- Imports ---
 import os
 import torch
+import json
 import threading
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from pyngrok import ngrok
 from kaggle_secrets import UserSecretsClient
 from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig
 from peft import PeftModel, LoraConfig
+from caption_batcher import MicroBatcher, generate_captions, stream_caption # Upload caption_batcher.py next to this notebook
+from metrics import registry, span # ...and metrics.py
 
 # --- Configuration & Secrets ---
 print("Setting up configuration...")
@@ -47,6 +50,7 @@ print("Loading tokenizer...")
 tokenizer = AutoTokenizer.from_pretrained(base_model_id, trust_remote_code=True)
 if tokenizer.pad_token is None:
     tokenizer.pad_token = tokenizer.eos_token
+tokenizer.padding_side = "left" # Batched prompts must end at the same position for generation
 
 # Define the Adapter Config Locally
 config = LoraConfig(
@@ -59,6 +63,22 @@ model = PeftModel.from_pretrained(base_model, adapter_id, config=config)
 print("✅ Model and adapter loaded successfully!")
 
 
+# --- Micro-batching ---
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", 8)) # Captions generated together in one padded call
+MAX_WAIT_MS = int(os.environ.get("MAX_WAIT_MS", 50)) # How long the first request waits for others to join its batch
+
+SAMPLING_KWARGS = dict(do_sample=True, temperature=0.7, top_p=0.95)
+
+# Batched and streamed generations take turns on the GPU
+generation_lock = threading.Lock()
+
+def generate_batch(summaries):
+    print(f"Generating {len(summaries)} caption(s) in one batch...")
+    with generation_lock:
+        return generate_captions(model, tokenizer, summaries, "cuda", max_new_tokens=1536, **SAMPLING_KWARGS)
+
+batcher = MicroBatcher(generate_batch, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS)
+
 # --- Flask Web Server Definition ---
 app = Flask(__name__)
 
@@ -70,40 +90,66 @@ def generate_caption_route():
         return jsonify({"error": "No summary provided"}), 400
     news_snippet = data["summary"]
 
-    # Define the prompting strategy
-    system_prompt = "You are a creative sports journalist for @versus. Your task is to write an exciting, high-energy, and stylized caption based on the news provided. Do not fact-check the news; accept it as true and write a caption in the signature @versus style."
-    user_prompt = f"Write a sports caption in the @versus style about this news: {news_snippet}"
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": user_prompt},
-    ]
-
-    # Format the prompt and tokenize
-    formatted_prompt = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-    inputs = tokenizer(formatted_prompt, return_tensors="pt", padding=True).to("cuda")
-
-    # Generate the response
+    # Concurrent requests are grouped into one generate call by the batcher
     try:
         print(f"Generating caption for: {news_snippet[:50]}...")
-        outputs = model.generate(
-            **inputs,
-            max_new_tokens=1536,
-            do_sample=True,
-            temperature=0.7,
-            top_p=0.95,
-            eos_token_id=tokenizer.eos_token_id
-        )
-        generated_text = tokenizer.decode(outputs[0][len(inputs.input_ids[0]):], skip_special_tokens=True)
+        with span("caption_request"): # Queueing for a batch plus generation
+            generated_text = batcher.submit(news_snippet).result()
         print("✅ Caption generated successfully.")
-        return jsonify({"stylized_caption": generated_text.strip()})
+        return jsonify({"stylized_caption": generated_text})
 
     except Exception as e:
         print(f"🔴 ERROR during caption generation: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route("/generate-captions", methods=['POST'])
+def generate_captions_route():
+    data = request.get_json()
+    if not data or not isinstance(data.get("summaries"), list) or not data["summaries"]:
+        return jsonify({"error": "No summaries provided"}), 400
+
+    try:
+        captions = batcher.generate(data["summaries"])
+        print(f"✅ {len(captions)} captions generated successfully.")
+        return jsonify({"stylized_captions": captions})
+
+    except Exception as e:
+        print(f"🔴 ERROR during caption generation: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/generate-caption-stream", methods=['POST'])
+def generate_caption_stream_route():
+    data = request.get_json()
+    if not data or "summary" not in data:
+        return jsonify({"error": "No summary provided"}), 400
+    news_snippet = data["summary"]
+
+    # Server-Sent Events: one {"token"} event per decoded piece, then a final {"done"} event
+    def events():
+        pieces = []
+        try:
+            with generation_lock:
+                print(f"Streaming caption for: {news_snippet[:50]}...")
+                for text in stream_caption(model, tokenizer, news_snippet, "cuda", max_new_tokens=1536, **SAMPLING_KWARGS):
+                    pieces.append(text)
+                    yield f"data: {json.dumps({'token': text})}\n\n"
+            print("✅ Caption streamed successfully.")
+            yield f"data: {json.dumps({'done': True, 'stylized_caption': ''.join(pieces).strip()})}\n\n"
+        except Exception as e:
+            print(f"🔴 ERROR during caption streaming: {e}")
+            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.route("/metrics", methods=['GET'])
+def metrics_route():
+    # Prometheus text format: tokenize/generate/decode stage timings, batch and token counters
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
 # --- Server Startup Logic ---
 def run_app():
-    app.run(port=5000)
+    # Threaded, so concurrent requests can reach the batcher together
+    app.run(port=5000, threaded=True)
 
 # Run Flask in a separate thread so it doesn't block the notebook
 flask_thread = threading.Thread(target=run_app)
@@ -0,0 +1,125 @@
+import os
+import time
+import threading
+from dotenv import load_dotenv
+from database import (
+    AUTO_MIGRATE, init_db, save_news_result, claim_next_ingest_job, finish_ingest_job,
+    enqueue_ingest_job, get_scheduled_ingest_targets, fail_stale_ingest_jobs, prune_news_history
+)
+from news_pipeline import run_news_pipeline, get_insta_user_ids, PipelineHalted, PipelineError
+from cancellation import CancellationToken
+from clients import warm_instagram_client
+from metrics import count, start_metrics_server, start_snapshot_writer, METRICS_MULTIPROC_DIR
+
+load_dotenv()
+
+# --- Worker Configuration ---
+INGEST_INTERVAL_MINUTES = float(os.environ.get("INGEST_INTERVAL_MINUTES", 10)) # Cadence of scheduled refreshes
+INGEST_ACTIVE_HOURS = int(os.environ.get("INGEST_ACTIVE_HOURS", 24)) # Keep refreshing keys requested within this window
+INGEST_POLL_SECONDS = float(os.environ.get("INGEST_POLL_SECONDS", 2)) # How often an idle worker checks the queue
+INGEST_JOB_TIMEOUT_MINUTES = int(os.environ.get("INGEST_JOB_TIMEOUT_MINUTES", 30)) # Running jobs older than this are failed
+INGEST_HISTORY_KEEP = int(os.environ.get("INGEST_HISTORY_KEEP", 5)) # Results and finished jobs kept per (user, time_limit) key
+INGEST_METRICS_PORT = int(os.environ.get("INGEST_METRICS_PORT", 0)) # Serve Prometheus metrics from a standalone worker (0 = off)
+
+def process_job(job_id, user_id, time_limit, scheduled=False):
+    """Runs the pipeline for one claimed job and records the outcome."""
+    print(f"Running {'scheduled ' if scheduled else ''}ingest job {job_id} (user {user_id}, time_limit {time_limit})...")
+    # Cancels issued through /api/jobs/<id>/cancel reach this run via the job's row
+    cancel_token = CancellationToken(job_id)
+    try:
+        # Only runs the user asked for mark their content seen; scheduled ones re-rank the whole window
+        payload = run_news_pipeline(user_id, time_limit, cancel_token, claim=not scheduled)
+    except PipelineHalted:
+        print(f"🛑 Ingest job {job_id} halted by user.")
+        finish_ingest_job(job_id, 'halted')
+        count("ingest_jobs", status="halted")
+        return
+    except PipelineError as e:
+        print(f"🔴 ERROR in ingest job {job_id}: {e.message}")
+        finish_ingest_job(job_id, 'failed', error=e.message if not e.details else f"{e.message} {e.details}")
+        count("ingest_jobs", status="failed")
+        return
+    except Exception as e:
+        print(f"🔴 ERROR in ingest job {job_id}: {e}")
+        finish_ingest_job(job_id, 'failed', error=str(e))
+        count("ingest_jobs", status="failed")
+        return
+
+    if cancel_token.is_cancelled():
+        print(f"🛑 Ingest job {job_id} was cancelled as it finished; discarding its result.")
+        finish_ingest_job(job_id, 'halted')
+        count("ingest_jobs", status="halted")
+        return
+
+    result_id = save_news_result(user_id, time_limit, payload)
+    finish_ingest_job(job_id, 'done', result_id=result_id)
+    count("ingest_jobs", status="done")
+    print(f"✅ Ingest job {job_id} complete. Result {result_id} stored.")
+
+def process_next_job():
+    """Claims and runs the oldest pending job. Returns False when the queue is empty."""
+    job = claim_next_ingest_job()
+    if job is None:
+        return False
+    job_id, user_id, time_limit, scheduled = job
+    process_job(job_id, user_id, time_limit, scheduled)
+    # Scheduled refreshes add a result every cycle; older ones are superseded by the latest
+    try:
+        results_removed, jobs_removed = prune_news_history(user_id, time_limit, INGEST_HISTORY_KEEP)
+        if results_removed or jobs_removed:
+            print(f"Pruned {results_removed} old results and {jobs_removed} finished jobs for user {user_id}.")
+    except Exception as e:
+        print(f"🟠 Could not prune ingest history: {e}")
+    return True
+
+def schedule_refreshes():
+    """Enqueues a refresh for every recently requested (user, time_limit) key that isn't already queued."""
+    targets = get_scheduled_ingest_targets(INGEST_ACTIVE_HOURS)
+    for user_id, time_limit in targets:
+        enqueue_ingest_job(user_id, time_limit, scheduled=True)
+    if targets:
+        print(f"Scheduled {len(targets)} background refreshes.")
+
+def run_worker(stop_event=None):
+    """Polls the job queue forever, scheduling refreshes every INGEST_INTERVAL_MINUTES."""
+    stop_event = stop_event or threading.Event()
+    # Resolve account ids right after login, before the first job needs them
+    warm_instagram_client(on_ready=get_insta_user_ids)
+    failed = fail_stale_ingest_jobs(INGEST_JOB_TIMEOUT_MINUTES)
+    if failed:
+        print(f"🟠 Marked {failed} stale ingest jobs as failed.")
+
+    next_schedule = time.monotonic()
+    print("✅ Ingest worker started.")
+    while not stop_event.is_set():
+        try:
+            if time.monotonic() >= next_schedule:
+                schedule_refreshes()
+                next_schedule = time.monotonic() + INGEST_INTERVAL_MINUTES * 60
+            if not process_next_job():
+                stop_event.wait(INGEST_POLL_SECONDS)
+        except Exception as e:
+            print(f"🔴 ERROR in ingest worker loop: {e}")
+            stop_event.wait(INGEST_POLL_SECONDS)
+
+def start_worker_thread():
+    """Runs the worker inside the current process, for single-process development setups."""
+    thread = threading.Thread(target=run_worker, name="ingest-worker", daemon=True)
+    thread.start()
+    return thread
+
+# --- Main execution ---
+if __name__ == '__main__':
+    if AUTO_MIGRATE:
+        try:
+            init_db()
+            print("✅ Database initialized.")
+        except Exception as e:
+            print(f"🔴 ERROR: Could not initialize database: {e}")
+            exit()
+    if INGEST_METRICS_PORT:
+        start_metrics_server(INGEST_METRICS_PORT)
+    # On the web workers' host, pointing METRICS_MULTIPROC_DIR at their directory adds the pipeline metrics to /api/metrics
+    if METRICS_MULTIPROC_DIR:
+        start_snapshot_writer()
+    run_worker()
@@ -0,0 +1,242 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from database import get_insta_user_ids, save_insta_user_id, delete_insta_user_id
+from metrics import span, bind_timings
+
+# --- Concurrency & Rate Limit Configuration ---
+INSTA_MAX_WORKERS = int(os.environ.get("INSTA_MAX_WORKERS", 3)) # Accounts fetched at the same time
+INSTA_ACCOUNT_TIMEOUT = float(os.environ.get("INSTA_ACCOUNT_TIMEOUT", 60)) # Seconds before an account is given up on
+INSTA_RATE_PER_SECOND = float(os.environ.get("INSTA_RATE_PER_SECOND", 1.0)) # Sustained private-API calls per second
+INSTA_RATE_BURST = int(os.environ.get("INSTA_RATE_BURST", 3)) # Calls allowed back to back before throttling
+INSTA_PAGE_SIZE = int(os.environ.get("INSTA_PAGE_SIZE", 5)) # Medias per page when paging up to a high-water mark
+
+class FetchHalted(Exception):
+    """Raised inside a worker when the caller asked the fetch to stop."""
+
+class TokenBucket:
+    """Thread-safe token bucket shared by every worker hitting the Instagram API."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, should_halt=None):
+        """Blocks until a token is available, polling should_halt while waiting."""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_seconds = (1 - self._tokens) / self.rate
+            if should_halt and should_halt():
+                raise FetchHalted()
+            time.sleep(min(wait_seconds, 0.25))
+
+_rate_limiter = TokenBucket(INSTA_RATE_PER_SECOND, INSTA_RATE_BURST)
+
+class UserIdCache:
+    """
+    Username -> Instagram user id map. Ids never change, so they are kept in
+    memory and persisted to Postgres, which every worker process shares.
+    """
+
+    def __init__(self, client, rate_limiter=None):
+        self.client = client
+        self.rate_limiter = rate_limiter or _rate_limiter
+        self._user_ids = {}
+        self._resolving = {}
+        self._lock = threading.Lock()
+
+    def warm(self, usernames):
+        """Loads stored ids and resolves any missing ones on a background thread."""
+        try:
+            stored = get_insta_user_ids(usernames)
+        except Exception as e:
+            print(f"🟠 Could not load cached Instagram user ids: {e}")
+            stored = {}
+        with self._lock:
+            self._user_ids.update(stored)
+        missing = [username for username in usernames if username not in stored]
+        if missing:
+            print(f"Resolving {len(missing)} uncached Instagram user ids in the background...")
+            for username in missing:
+                self.refresh_in_background(username)
+        else:
+            print("✅ Instagram user ids loaded from cache.")
+
+    def get(self, username, should_halt=None):
+        with self._lock:
+            insta_user_id = self._user_ids.get(username)
+            in_flight = self._resolving.get(username)
+        if insta_user_id is not None:
+            return insta_user_id
+        if in_flight is not None:
+            # A background resolve is already spending the API call for this account
+            self._wait_for(in_flight, should_halt)
+            with self._lock:
+                insta_user_id = self._user_ids.get(username)
+            if insta_user_id is not None:
+                return insta_user_id
+        stored = get_insta_user_ids([username])
+        if username in stored:
+            with self._lock:
+                self._user_ids[username] = stored[username]
+            return stored[username]
+        return self._resolve(username, should_halt)
+
+    def invalidate(self, username):
+        with self._lock:
+            self._user_ids.pop(username, None)
+        try:
+            delete_insta_user_id(username)
+        except Exception as e:
+            print(f"🟠 Could not drop cached Instagram user id for @{username}: {e}")
+
+    def refresh_in_background(self, username):
+        with self._lock:
+            if username in self._resolving:
+                return
+            done = self._resolving[username] = threading.Event()
+
+        def run():
+            try:
+                self._resolve(username)
+            except Exception as e:
+                print(f"🔴 ERROR resolving Instagram user id for @{username}: {e}")
+            finally:
+                with self._lock:
+                    self._resolving.pop(username, None)
+                done.set()
+
+        threading.Thread(target=run, name=f"insta-resolve-{username}", daemon=True).start()
+
+    def _wait_for(self, done, should_halt=None):
+        """Blocks until an in-flight resolve finishes, polling should_halt while waiting."""
+        while not done.wait(0.25):
+            if should_halt and should_halt():
+                raise FetchHalted()
+
+    def _resolve(self, username, should_halt=None):
+        self.rate_limiter.acquire(should_halt)
+        insta_user_id = str(self.client.user_id_from_username(username))
+        with self._lock:
+            self._user_ids[username] = insta_user_id
+        save_insta_user_id(username, insta_user_id)
+        return insta_user_id
+
+def is_newer_than(media, since_pk):
+    return since_pk is None or int(media.pk) > int(since_pk)
+
+def fetch_new_medias(client, insta_user_id, amount, rate_limiter, should_halt=None, since_pk=None):
+    """
+    Returns up to `amount` medias newer than `since_pk`, newest first. With a
+    high-water mark the feed is paged in small chunks and pagination stops at
+    the first page that reaches already-seen posts.
+    """
+    if since_pk is None or not hasattr(client, "user_medias_paginated"):
+        rate_limiter.acquire(should_halt)
+        medias = client.user_medias(insta_user_id, amount=amount)
+        return [media for media in medias if is_newer_than(media, since_pk)]
+
+    collected = []
+    end_cursor = ""
+    while len(collected) < amount:
+        rate_limiter.acquire(should_halt)
+        medias, end_cursor = client.user_medias_paginated(insta_user_id, amount=min(INSTA_PAGE_SIZE, amount), end_cursor=end_cursor)
+        collected.extend(media for media in medias if is_newer_than(media, since_pk))
+        # Pinned posts can be older than the mark, so judge a page by its oldest entry
+        if not medias or not end_cursor or not is_newer_than(medias[-1], since_pk):
+            break
+        if should_halt and should_halt():
+            raise FetchHalted()
+    return collected[:amount]
+
+def fetch_account_medias(client, username, amount, rate_limiter, should_halt=None, user_id_cache=None, since_pk=None):
+    """Resolves one account and returns its new medias, spending one token per API call."""
+    if user_id_cache is None:
+        rate_limiter.acquire(should_halt)
+        insta_user_id = client.user_id_from_username(username)
+    else:
+        insta_user_id = user_id_cache.get(username, should_halt)
+    if should_halt and should_halt():
+        raise FetchHalted()
+    try:
+        return fetch_new_medias(client, insta_user_id, amount, rate_limiter, should_halt, since_pk)
+    except FetchHalted:
+        raise
+    except Exception:
+        # A failed lookup may mean the cached id is stale; re-resolve it off the request path.
+        # The old id stays in place until the new one is stored.
+        if user_id_cache is not None:
+            user_id_cache.refresh_in_background(username)
+        raise
+
+def fetch_accounts_concurrently(client, usernames, amount=10, should_halt=None, max_workers=None,
+                                account_timeout=None, rate_limiter=None, user_id_cache=None, since_pks=None):
+    """
+    Fetches medias for every account on a bounded worker pool. `since_pks`
+    maps usernames to the newest media pk already seen for that account.
+    Returns (medias_by_username, halted). Accounts that fail or exceed the
+    per-account timeout are logged and left out of the result.
+    """
+    max_workers = max_workers or INSTA_MAX_WORKERS
+    account_timeout = account_timeout or INSTA_ACCOUNT_TIMEOUT
+    rate_limiter = rate_limiter or _rate_limiter
+    should_halt = should_halt or (lambda: False)
+    since_pks = since_pks or {}
+
+    results = {}
+    started_at = {}
+    halted = False
+
+    def run(username):
+        started_at[username] = time.monotonic()
+        print(f"Fetching posts for @{username}...")
+        with span("instagram_account", account=username):
+            return fetch_account_medias(client, username, amount, rate_limiter, should_halt, user_id_cache, since_pks.get(username))
+
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="insta-fetch")
+    run = bind_timings(run)
+    futures = {executor.submit(run, username): username for username in usernames}
+    pending = set(futures)
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=0.25, return_when=FIRST_COMPLETED)
+            for future in done:
+                username = futures[future]
+                try:
+                    results[username] = future.result()
+                except FetchHalted:
+                    halted = True
+                except Exception as e:
+                    print(f"🔴 ERROR fetching posts for @{username}: {e}")
+
+            if halted or should_halt():
+                halted = True
+                print("🛑 Instagram fetch halted by user.")
+                break
+
+            now = time.monotonic()
+            for future in list(pending):
+                username = futures[future]
+                if username in started_at and now - started_at[username] > account_timeout:
+                    print(f"🟠 Timed out fetching posts for @{username} after {account_timeout}s.")
+                    future.cancel()
+                    pending.discard(future)
+    finally:
+        # Don't wait on abandoned (timed out or halted) workers; queued ones are dropped.
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    ordered = {username: results[username] for username in usernames if username in results}
+    return ordered, halted
@@ -0,0 +1,114 @@
+import os
+import json
+import hashlib
+import threading
+from database import get_llm_cache_entries, set_llm_cache_entries, evict_llm_cache
+from metrics import count
+
+# --- LLM Cache Configuration ---
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_TTL_HOURS = int(os.environ.get("LLM_CACHE_TTL_HOURS", 72)) # Entries older than this are recomputed
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 5000)) # Least recently used entries beyond this are evicted
+LLM_CACHE_EVICT_EVERY = 100 # Writes between eviction passes
+
+STYLIZER_MODEL_NAME = os.environ.get("STYLIZER_MODEL_NAME", "raajveerk/llama-3.1-8b-versus-caption-v1.0")
+STYLIZER_TEMPLATE_VERSION = "v1" # Bump when the inference server's prompt changes, so old captions stop matching
+
+_writes_since_eviction = 0
+_writes_lock = threading.Lock()
+
+def make_cache_key(kind, model_name, template, text):
+    """Content address for one LLM call: sha256 over the kind, model, prompt template and input text."""
+    material = json.dumps({
+        "kind": kind,
+        "model": model_name,
+        "template": hashlib.sha256(template.encode("utf-8")).hexdigest(),
+        "input": text,
+    }, sort_keys=True)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+def _lookup(cache_keys):
+    if not LLM_CACHE_ENABLED:
+        return {}
+    try:
+        return get_llm_cache_entries(cache_keys, LLM_CACHE_TTL_HOURS)
+    except Exception as e:
+        print(f"🟠 LLM cache lookup failed: {e}")
+        return {}
+
+def _store(entries):
+    global _writes_since_eviction
+    if not LLM_CACHE_ENABLED or not entries:
+        return
+    try:
+        set_llm_cache_entries(entries)
+        with _writes_lock:
+            _writes_since_eviction += len(entries)
+            evict = _writes_since_eviction >= LLM_CACHE_EVICT_EVERY
+            if evict:
+                _writes_since_eviction = 0
+        if evict:
+            removed = evict_llm_cache(LLM_CACHE_TTL_HOURS, LLM_CACHE_MAX_ENTRIES)
+            if removed:
+                print(f"Evicted {removed} LLM cache entries.")
+    except Exception as e:
+        print(f"🟠 LLM cache write failed: {e}")
+
+def cached_call(kind, model_name, template, text, compute):
+    """
+    Returns the cached result for this (kind, model, template, text) or calls
+    compute() and caches its JSON-serialisable result. Exceptions are not cached.
+    """
+    cache_key = make_cache_key(kind, model_name, template, text)
+    cached = _lookup([cache_key])
+    if cache_key in cached:
+        print(f"✅ LLM cache hit ({kind}).")
+        count("llm_cache", kind=kind, result="hit")
+        return cached[cache_key]
+    count("llm_cache", kind=kind, result="miss")
+    value = compute()
+    _store([(cache_key, kind, value)])
+    return value
+
+def cached_call_many(kind, model_name, template, texts, compute_missing):
+    """
+    Batched cached_call: looks up every text in one query and calls
+    compute_missing(missing_texts) once for the rest. compute_missing returns one
+    result per text, in order, with None for items it could not produce (not cached).
+    """
+    cache_keys = [make_cache_key(kind, model_name, template, text) for text in texts]
+    cached = _lookup(cache_keys)
+    missing = [index for index, cache_key in enumerate(cache_keys) if cache_key not in cached]
+    if len(missing) < len(texts):
+        print(f"✅ LLM cache hit for {len(texts) - len(missing)} of {len(texts)} items ({kind}).")
+    count("llm_cache", len(texts) - len(missing), kind=kind, result="hit")
+    count("llm_cache", len(missing), kind=kind, result="miss")
+
+    values = [cached.get(cache_key) for cache_key in cache_keys]
+    if missing:
+        computed = compute_missing([texts[index] for index in missing])
+        for index, value in zip(missing, computed):
+            values[index] = value
+        _store([(cache_keys[index], kind, value) for index, value in zip(missing, computed) if value is not None])
+    return values
+
+def cached_stylize_many(client, summaries, should_halt=None):
+    """Stylizes summaries through the client, serving repeats from the cache. Error captions are not cached."""
+    cache_keys = [make_cache_key("stylize", STYLIZER_MODEL_NAME, STYLIZER_TEMPLATE_VERSION, summary) for summary in summaries]
+    cached = _lookup(cache_keys)
+    missing = [index for index, cache_key in enumerate(cache_keys) if cache_key not in cached]
+    if len(missing) < len(summaries):
+        print(f"✅ LLM cache hit for {len(summaries) - len(missing)} of {len(summaries)} captions.")
+    count("llm_cache", len(summaries) - len(missing), kind="stylize", result="hit")
+    count("llm_cache", len(missing), kind="stylize", result="miss")
+
+    captions = [cached.get(cache_key) for cache_key in cache_keys]
+    generated = client.stylize_many([summaries[index] for index in missing], should_halt=should_halt)
+    for index, caption in zip(missing, generated):
+        captions[index] = caption
+    _store([
+        (cache_keys[index], "stylize", caption)
+        for index, caption in zip(missing, generated)
+        if not caption.startswith("Error:")
+    ])
+    return captions
@@ -0,0 +1,296 @@
+import os
+import glob
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- Metrics Configuration ---
+METRICS_PREFIX = "versus"
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300) # Seconds, for the stage histogram
+METRICS_MULTIPROC_DIR = os.environ.get("METRICS_MULTIPROC_DIR") # Processes writing here are rendered as one (gunicorn workers, ingest worker)
+METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", 5)) # How often each process writes its metrics to that directory
+
+class MetricsRegistry:
+    """
+    Thread-safe in-process counters, gauges and stage-duration histograms,
+    rendered in the Prometheus text exposition format. Each process keeps its own;
+    with METRICS_MULTIPROC_DIR set, render() adds up every process that writes there.
+    """
+
+    def __init__(self, buckets=STAGE_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def add_collector(self, collect):
+        """Registers a callable run before every render and snapshot, e.g. to sample gauges."""
+        self._collectors.append(collect)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": [0] * len(self.buckets), "count": 0, "sum": 0.0}
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["count"] += 1
+            histogram["sum"] += seconds
+
+    def snapshot(self):
+        """Returns (counters, gauges, histograms) of this process, after running the collectors."""
+        for collect in list(self._collectors):
+            try:
+                collect()
+            except Exception as e:
+                print(f"🟠 Metrics collector failed: {e}")
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {key: {**value, "buckets": list(value["buckets"])} for key, value in self._histograms.items()}
+        return counters, gauges, histograms
+
+    def render(self):
+        """Returns every metric in the Prometheus text format."""
+        if METRICS_MULTIPROC_DIR:
+            counters, gauges, histograms = _merge_process_snapshots(self, METRICS_MULTIPROC_DIR)
+        else:
+            counters, gauges, histograms = self.snapshot()
+
+        lines = []
+        lines += _render_simple(counters, "counter")
+        lines += _render_simple(gauges, "gauge")
+        for name in sorted({name for name, _ in histograms}):
+            full_name = f"{METRICS_PREFIX}_{name}"
+            lines.append(f"# TYPE {full_name} histogram")
+            for (metric, labels), histogram in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(self.buckets, histogram["buckets"]):
+                    lines.append(f"{full_name}_bucket{_format_labels(labels + (('le', repr(float(bound))),))} {count}")
+                lines.append(f"{full_name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram['count']}")
+                lines.append(f"{full_name}_sum{_format_labels(labels)} {histogram['sum']:.6f}")
+                lines.append(f"{full_name}_count{_format_labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+def _render_simple(series, metric_type):
+    lines = []
+    for name in sorted({name for name, _ in series}):
+        full_name = f"{METRICS_PREFIX}_{name}"
+        lines.append(f"# TYPE {full_name} {metric_type}")
+        for (metric, labels), value in sorted(series.items()):
+            if metric == name:
+                lines.append(f"{full_name}{_format_labels(labels)} {value}")
+    return lines
+
+registry = MetricsRegistry()
+
+# --- Multi-process metrics ---
+# Each process periodically writes its cumulative metrics to <METRICS_MULTIPROC_DIR>/<pid>.json, and render() sums
+# counters and histograms over every file, so a scrape gets the same totals whichever gunicorn worker answers it.
+# Files of exited workers are kept (their counts stay in the totals); the directory is cleared when gunicorn starts.
+
+def _snapshot_path(directory, pid):
+    return os.path.join(directory, f"{pid}.json")
+
+def write_snapshot(directory=None, source=None):
+    """Writes this process's metrics to the shared directory (atomically, so readers never see half a file)."""
+    directory = directory or METRICS_MULTIPROC_DIR
+    counters, gauges, histograms = (source or registry).snapshot()
+    data = {
+        "counters": [[name, labels, value] for (name, labels), value in counters.items()],
+        "gauges": [[name, labels, value] for (name, labels), value in gauges.items()],
+        "histograms": [[name, labels, value] for (name, labels), value in histograms.items()],
+    }
+    os.makedirs(directory, exist_ok=True)
+    path = _snapshot_path(directory, os.getpid())
+    # The writer thread and a scrape can both write this process's file, so each uses its own temp file
+    temp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+def _series_from_json(entries):
+    return {(name, tuple(tuple(label) for label in labels)): value for name, labels, value in entries}
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _merge_process_snapshots(live_registry, directory):
+    """Sums counters and histograms across the directory's snapshots; gauges are kept per live process, labelled by pid."""
+    # Every process, this one included, is read from its file: each file only ever grows, so the totals never
+    # go backwards between scrapes answered by different workers (which Prometheus would take for a reset)
+    write_snapshot(directory, live_registry)
+    counters, gauges, histograms = {}, {}, {}
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        try:
+            pid = int(os.path.basename(path)[:-len(".json")])
+            with open(path) as f:
+                data = json.load(f)
+        except (ValueError, OSError) as e:
+            print(f"🟠 Skipping metrics snapshot {path}: {e}")
+            continue
+        for key, value in _series_from_json(data["counters"]).items():
+            counters[key] = counters.get(key, 0) + value
+        if _pid_alive(pid): # An exited worker's pool and cache sizes are no longer meaningful
+            for (name, labels), value in _series_from_json(data["gauges"]).items():
+                gauges[(name, labels + (("pid", str(pid)),))] = value
+        for key, value in _series_from_json(data["histograms"]).items():
+            merged = histograms.setdefault(key, {"buckets": [0] * len(live_registry.buckets), "count": 0, "sum": 0.0})
+            merged["buckets"] = [a + b for a, b in zip(merged["buckets"], value["buckets"])]
+            merged["count"] += value["count"]
+            merged["sum"] += value["sum"]
+    return counters, gauges, histograms
+
+def clear_snapshots(directory=None):
+    """Creates the shared directory, removing snapshots left by a previous run."""
+    directory = directory or METRICS_MULTIPROC_DIR
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, "*.json*")):
+        os.remove(path)
+
+def start_snapshot_writer(directory=None, interval=None):
+    """Writes this process's snapshot every METRICS_FLUSH_SECONDS from a daemon thread. Call it after forking."""
+    directory = directory or METRICS_MULTIPROC_DIR
+    interval = interval or METRICS_FLUSH_SECONDS
+
+    def flush_forever():
+        while True:
+            try:
+                write_snapshot(directory)
+            except Exception as e:
+                print(f"🟠 Could not write metrics snapshot: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=flush_forever, name="metrics-writer", daemon=True)
+    thread.start()
+    return thread
+
+class Timings:
+    """Per-run record of stage durations and counts, returned as a response's `timings` block."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = []
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def add_stage(self, stage, seconds, labels):
+        with self._lock:
+            self.stages.append({"stage": stage, "seconds": round(seconds, 4), **labels})
+
+    def add_count(self, name, value, labels):
+        key = "_".join([name, *map(str, labels.values())])
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + value
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "total_seconds": round(time.perf_counter() - self.started, 4),
+                "stages": list(self.stages),
+                "counts": dict(self.counts),
+            }
+
+_current_timings = contextvars.ContextVar("current_timings", default=None)
+
+@contextmanager
+def collect_timings():
+    """Collects every span and count recorded in this context (and bound worker threads) into a Timings."""
+    timings = Timings()
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+def bind_timings(fn):
+    """Wraps fn so spans it records on another thread (e.g. a ThreadPoolExecutor) land in the caller's Timings."""
+    timings = _current_timings.get()
+    if timings is None:
+        return fn
+
+    def run(*args, **kwargs):
+        token = _current_timings.set(timings)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current_timings.reset(token)
+    return run
+
+@contextmanager
+def span(stage, **labels):
+    """Times a block as `stage_seconds{stage=...}` and adds it to the current Timings, if any."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        registry.observe("stage_seconds", seconds, stage=stage, **labels)
+        timings = _current_timings.get()
+        if timings is not None:
+            timings.add_stage(stage, seconds, labels)
+
+def count(name, value=1, **labels):
+    """Increments counter `name_total` and the current Timings' matching count."""
+    if not value:
+        return
+    registry.inc(f"{name}_total", value, **labels)
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add_count(name, value, labels)
+
+def record_gemini_usage(response, model_name):
+    """Counts prompt and completion tokens reported by a Gemini response."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    count("llm_tokens", getattr(usage, "prompt_token_count", 0) or 0, model=model_name, type="prompt")
+    count("llm_tokens", getattr(usage, "candidates_token_count", 0) or 0, model=model_name, type="completion")
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """Serves this process's metrics on http://host:port/ from a daemon thread (for processes without Flask)."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"✅ Metrics served on port {port}.")
+    return server
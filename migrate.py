@@ -0,0 +1,13 @@
+from dotenv import load_dotenv
+from database import init_db
+
+# Applies the schema (tables, indexes and data migrations). Run once per deploy when the app
+# and ingest worker start with AUTO_MIGRATE=0. Safe to re-run: every step is idempotent.
+if __name__ == '__main__':
+    load_dotenv()
+    try:
+        init_db()
+        print("✅ Database migrated.")
+    except Exception as e:
+        print(f"🔴 ERROR: Could not migrate database: {e}")
+        exit(1)
@@ -0,0 +1,307 @@
+import os
+import json
+import threading
+from dotenv import load_dotenv
+from datetime import datetime, timedelta, timezone
+from clients import get_gemini_model, get_instagram_client
+from database import add_new_posts, get_source_states, save_source_states, claim_unseen_content
+from rss_handler import fetch_and_store_articles, is_source_due
+from insta_handler import fetch_accounts_concurrently, UserIdCache
+from stylizer import get_stylization_client
+from llm_cache import cached_call, cached_stylize_many
+from prompt_builder import pack_items, RANKING_MAX_CHUNKS
+from clustering import cluster_items
+from cancellation import CancellationToken, Cancelled, run_cancellable
+from metrics import span, count, collect_timings, bind_timings, record_gemini_usage
+from concurrent.futures import ThreadPoolExecutor
+from itertools import zip_longest
+
+load_dotenv()
+
+# --- Constants ---
+GEMINI_MODEL_NAME = 'gemini-2.5-flash'
+INSTA_POLL_INTERVAL_MINUTES = float(os.environ.get("INSTA_POLL_INTERVAL_MINUTES", 5)) # Shared fetch reused within this window
+INGEST_MAX_AGE_HOURS = int(os.environ.get("INGEST_MAX_AGE_HOURS", 24)) # Content older than this isn't ingested (0 = no limit)
+
+# --- Journalist & Prompt Definitions ---
+INSTA_USERNAMES = ["fabriziorom", "433", "davidornstein", "theathleticfc", "goalglobal", "brfootball", ]
+
+# Username -> user id lookups are persisted, so refreshes skip one API call per account
+_insta_user_ids = None
+_insta_user_ids_lock = threading.Lock()
+
+def get_insta_user_ids(client):
+    """The shared UserIdCache, created and warmed by the worker's login thread or, failing that, the first Instagram fetch."""
+    global _insta_user_ids
+    with _insta_user_ids_lock:
+        if _insta_user_ids is None:
+            _insta_user_ids = UserIdCache(client)
+            _insta_user_ids.warm(INSTA_USERNAMES)
+        return _insta_user_ids
+
+BREAKING_NEWS_PROMPT_TEMPLATE = """
+You are a world-class sports news analyst. Your task is to analyze the provided Instagram post captions and RSS feed articles, then extract the top five most significant, confirmed breaking news stories.
+
+Instructions:
+1.  Read through all the content provided below.
+2.  Identify at least five of the most important and distinct news stories. A story could be a major transfer, a significant match result, or a key injury update.
+3.  For each story you identify, create a JSON object with three keys: "headline", "summary", and "source_caption".
+4.  The "summary" key should contain a neat summary of the news story, with enough context about the subjects of the story to understand its significance.
+5.  The "source_caption" key must contain the full, original caption or article summary from which the story was derived.
+6.  Return your findings as a single, valid JSON array containing these objects.
+7.  If no significant news is found, return an empty JSON array: [].
+
+Example JSON Output:
+[
+  {{
+    "headline": "Player X Signs for Team Y",
+    "summary": "Team Y has officially completed the signing of Player X from Team Z on a five-year contract.",
+    "source_caption": "- @fabriziorom: It’s confirmed! Player X to Team Y, here we go! All documents are signed and the medical is complete. A five-year deal that will be announced by the clubs tomorrow. 🔵 #Transfer"
+  }},
+  {{
+    "headline": "Team A Wins Domestic Cup Final",
+    "summary": "A late goal from their star striker secured the cup for Team A in a dramatic 2-1 victory over their rivals.",
+    "source_caption": "- @The Guardian RSS: Team A Wins Domestic Cup Final\nA late goal from their star striker secured the cup for Team A in a dramatic 2-1 victory over their rivals."
+  }}
+]
+
+Here is the latest content:
+---
+{all_content}
+---
+"""
+
+MERGE_RANKING_PROMPT_TEMPLATE = """
+You are a world-class sports news analyst. The stories below were shortlisted from separate batches of Instagram post captions and RSS feed articles.
+
+Instructions:
+1.  Merge stories that describe the same event into one.
+2.  Pick the five most significant and distinct stories overall.
+3.  Keep each chosen story's "headline", "summary", and "source_caption" as given (you may combine summaries of merged stories).
+4.  Return a single, valid JSON array of these objects, most significant first.
+5.  If none of the stories are significant, return an empty JSON array: [].
+
+Shortlisted stories (JSON):
+---
+{candidates}
+---
+"""
+
+class PipelineHalted(Exception):
+    """Raised when a pipeline run is stopped through its cancellation token."""
+
+class PipelineError(Exception):
+    """Raised when a pipeline run fails; details carries the underlying error, if any."""
+
+    def __init__(self, message, details=None):
+        super().__init__(message)
+        self.message = message
+        self.details = details
+
+# --- Core Logic ---
+def fetch_latest_insta_posts(should_halt=None):
+    """
+    Fetches new posts from our list of journalists into the shared content store.
+    Accounts polled within INSTA_POLL_INTERVAL_MINUTES are skipped, so concurrent
+    users share one fetch. Returns the newly stored posts.
+    """
+    min_timestamp = None
+    if INGEST_MAX_AGE_HOURS:
+        min_timestamp = datetime.now(timezone.utc) - timedelta(hours=INGEST_MAX_AGE_HOURS)
+
+    try:
+        # Only ask for posts newer than the last one seen per account
+        source_keys = {username: f"instagram:{username}" for username in INSTA_USERNAMES}
+        source_states = get_source_states(source_keys.values())
+        due_usernames = [
+            username for username in INSTA_USERNAMES
+            if is_source_due(source_states.get(source_keys[username]), INSTA_POLL_INTERVAL_MINUTES)
+        ]
+        if not due_usernames:
+            print("No Instagram accounts are due for polling.")
+            return []
+        since_pks = {
+            username: source_states[source_keys[username]]['last_item_id']
+            for username in due_usernames
+            if source_keys[username] in source_states
+        }
+
+        # Accounts are fetched in parallel on a bounded, rate-limited worker pool
+        client = get_instagram_client()
+        medias_by_username, halted = fetch_accounts_concurrently(
+            client, due_usernames, amount=10, should_halt=should_halt,
+            user_id_cache=get_insta_user_ids(client), since_pks=since_pks
+        )
+        if halted or not medias_by_username:
+            return []
+
+        candidate_posts = []
+        for username, medias in medias_by_username.items():
+            for media in medias:
+                if media.taken_at.tzinfo is None:
+                    media.taken_at = media.taken_at.replace(tzinfo=timezone.utc)
+
+                if min_timestamp and media.taken_at < min_timestamp:
+                    print(f"Skipping old Instagram post {media.pk} from @{username}. Timestamp: {media.taken_at}")
+                    continue
+
+                if media.caption_text:
+                    candidate_posts.append({
+                        'post_id': str(media.pk),
+                        'username': username,
+                        'caption': media.caption_text,
+                        'timestamp': media.taken_at
+                    })
+
+        # Dedup and store the whole batch in a single round trip
+        with span("db_store", source="instagram"):
+            new_posts = add_new_posts(candidate_posts)
+        count("items_fetched", len(candidate_posts), source="instagram")
+        count("items_new", len(new_posts), source="instagram")
+        skipped = len(candidate_posts) - len(new_posts)
+        if skipped:
+            print(f"Skipping {skipped} Instagram posts that already exist in the database.")
+
+        # Advance each account's high-water mark past everything fetched this round
+        new_states = {}
+        for username, medias in medias_by_username.items():
+            state = dict(source_states.get(source_keys[username], {}))
+            if medias:
+                newest = max(medias, key=lambda media: int(media.pk))
+                state['last_item_id'] = str(newest.pk)
+                state['last_published_at'] = newest.taken_at
+            new_states[source_keys[username]] = state
+        save_source_states(new_states)
+        return new_posts
+    except Exception as e:
+        print(f"🔴 ERROR during Instagram fetch: {e}")
+        return []
+
+def format_story(story):
+    """Formats a clustered story as a prompt line, crediting every source that reported it."""
+    also = [f"@{source}" for source in story["sources"] if source != story["source"]]
+    credit = f" (also reported by {', '.join(also)})" if also else ""
+    return f"- @{story['source']}{credit}: {story['text']}\n"
+
+def run_news_pipeline(user_id, time_limit_hours=None, cancel_token=None, claim=True):
+    """
+    Runs the full fetch -> rank -> stylize workflow for one user and time window.
+    Returns the payload served by /api/breaking-news, with per-stage `timings`.
+    With claim=False (scheduled refreshes) the ranked content isn't marked seen, so
+    each refresh ranks the whole unseen window instead of only what arrived since the last one.
+    Raises PipelineHalted once cancel_token is cancelled; in-flight Instagram, RSS,
+    Gemini and caption calls are abandoned.
+    """
+    with collect_timings() as timings:
+        with span("pipeline"):
+            payload = _run_pipeline_stages(user_id, time_limit_hours, cancel_token or CancellationToken(), claim)
+    payload["timings"] = timings.as_dict()
+    return payload
+
+def _run_pipeline_stages(user_id, time_limit_hours, cancel_token, claim):
+
+    def check_cancelled(stage):
+        if cancel_token.is_cancelled():
+            print(f"🛑 {stage} halted by user.")
+            raise PipelineHalted()
+
+    inference_url = os.environ.get("KAGGLE_INFERENCE_URL")
+    if not inference_url:
+        raise PipelineError("KAGGLE_INFERENCE_URL not set in .env file.")
+    gemini_model = get_gemini_model(GEMINI_MODEL_NAME)
+    if not gemini_model:
+        raise PipelineError("Gemini API not configured.")
+
+    # 1. Ingest new content from all sources into the shared store
+    with span("instagram_fetch"):
+        fetch_latest_insta_posts(should_halt=cancel_token.is_cancelled)
+    check_cancelled("Instagram fetch")
+
+    with span("rss_fetch"):
+        fetch_and_store_articles(INGEST_MAX_AGE_HOURS, should_halt=cancel_token.is_cancelled)
+    check_cancelled("RSS fetch")
+
+    # Pick the shared content this user hasn't seen yet within their time window
+    min_timestamp = None
+    if time_limit_hours:
+        min_timestamp = datetime.now(timezone.utc) - timedelta(hours=int(time_limit_hours))
+    with span("db_claim"):
+        posts, articles = claim_unseen_content(user_id, min_timestamp, claim=claim)
+
+    post_items = [{"source": post['username'], "text": post['caption']} for post in posts]
+    article_items = [{"source": article['source_name'], "text": f"{article['headline']}\n{article['summary']}"} for article in articles]
+    if not post_items and not article_items:
+        raise PipelineError("No new content found from any source.")
+    # Both lists are newest first; interleave them so a prompt budget trims the oldest of each
+    items = [item for pair in zip_longest(post_items, article_items) for item in pair if item is not None]
+    # The same story from several accounts and feeds is sent once, with everyone who reported it
+    with span("cluster"):
+        stories = cluster_items(items)
+    count("stories", len(stories))
+    print(f"Clustered {len(items)} items into {len(stories)} stories.")
+    content = [format_story(story) for story in stories]
+    chunks = pack_items(content)
+    print(f"Ranking {len(content)} stories in {len(chunks)} chunk(s)...")
+
+    # 2. Use Gemini to rank and extract news (identical content is served from the LLM cache)
+    def generate_json(prompt):
+        with span("gemini_call"):
+            response = run_cancellable(lambda: gemini_model.generate_content(prompt), cancel_token)
+        record_gemini_usage(response, GEMINI_MODEL_NAME)
+        
+        clean_response = response.text.strip().replace("```json", "").replace("```", "")
+        return json.loads(clean_response)
+
+    def rank_chunk(chunk):
+        return cached_call("rank", GEMINI_MODEL_NAME, BREAKING_NEWS_PROMPT_TEMPLATE, chunk,
+                           lambda: generate_json(BREAKING_NEWS_PROMPT_TEMPLATE.format(all_content=chunk)))
+
+    try:
+        with span("rank"):
+            if len(chunks) == 1:
+                ranked_news = rank_chunk(chunks[0])
+            else:
+                # Rank bounded chunks in parallel, then merge their shortlists in one small call
+                with ThreadPoolExecutor(max_workers=min(len(chunks), RANKING_MAX_CHUNKS), thread_name_prefix="rank") as executor:
+                    shortlists = list(executor.map(bind_timings(rank_chunk), chunks))
+                candidates = [story for shortlist in shortlists for story in shortlist]
+                check_cancelled("Ranking")
+                ranked_news = []
+                if candidates:
+                    candidates_json = json.dumps(candidates, ensure_ascii=False, indent=2)
+                    ranked_news = cached_call("merge_rank", GEMINI_MODEL_NAME, MERGE_RANKING_PROMPT_TEMPLATE, candidates_json,
+                                              lambda: generate_json(MERGE_RANKING_PROMPT_TEMPLATE.format(candidates=candidates_json)))
+
+    except PipelineHalted:
+        raise
+    except Cancelled:
+        print("🛑 Gemini analysis halted by user.")
+        raise PipelineHalted()
+    except Exception as e:
+        print(f"🔴 ERROR during Gemini analysis: {e}")
+        raise PipelineError("Failed to analyze news with Gemini.", details=str(e))
+
+    if not ranked_news:
+        return {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "posts": [],
+            "time_limit": time_limit_hours,
+            "user_id": user_id,
+            "message": "No significant news found to process."
+        }
+
+    # 3. Stylize every news item on your Kaggle server concurrently
+    stylizer = get_stylization_client(inference_url)
+    with span("stylize"):
+        captions = cached_stylize_many(stylizer, [item['summary'] for item in ranked_news], should_halt=cancel_token.is_cancelled)
+    check_cancelled("Stylization")
+    for item, caption in zip(ranked_news, captions):
+        item['versus_caption'] = caption
+
+    print("✅ Full workflow complete.")
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "posts": ranked_news,
+        "time_limit": time_limit_hours,
+        "user_id": user_id
+    }
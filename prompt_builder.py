@@ -0,0 +1,37 @@
+import os
+
+# --- Prompt Packing Configuration ---
+RANKING_CHUNK_TOKENS = int(os.environ.get("RANKING_CHUNK_TOKENS", 8000)) # Estimated content tokens per ranking call
+RANKING_MAX_CHUNKS = int(os.environ.get("RANKING_MAX_CHUNKS", 4)) # Older items beyond this many chunks are dropped
+CHARS_PER_TOKEN = 4 # Rough average for English text on Gemini/Llama tokenizers
+
+def estimate_tokens(text):
+    """Cheap token estimate, good enough for budgeting prompt size."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def pack_items(items, max_tokens=None, max_chunks=None):
+    """
+    Packs items, in order, into chunks whose estimated size stays within max_tokens.
+    Oversized items are truncated to fit. Items that don't fit in max_chunks are dropped.
+    Returns a list of chunk strings.
+    """
+    max_tokens = max_tokens or RANKING_CHUNK_TOKENS
+    max_chunks = max_chunks or RANKING_MAX_CHUNKS
+    chunks = []
+    current = []
+    current_tokens = 0
+    for index, item in enumerate(items):
+        if estimate_tokens(item) > max_tokens:
+            item = item[:max_tokens * CHARS_PER_TOKEN - 1]
+        item_tokens = estimate_tokens(item)
+        if current and current_tokens + item_tokens > max_tokens:
+            chunks.append("".join(current))
+            current, current_tokens = [], 0
+            if len(chunks) == max_chunks:
+                print(f"🟠 Prompt budget reached; dropping {len(items) - index} older items.")
+                return chunks
+        current.append(item)
+        current_tokens += item_tokens
+    if current:
+        chunks.append("".join(current))
+    return chunks
@@ -0,0 +1,90 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+# --- Response Cache Configuration ---
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 512))
+RESPONSE_CACHE_TTL_SECONDS = float(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", 30)) # Bounds staleness across worker processes
+
+class ResponseCache:
+    """
+    Thread-safe in-process LRU with a TTL, sitting in front of a shared store.
+    Concurrent misses for the same key are coalesced: one caller runs the loader,
+    the others wait for its result instead of hitting the store themselves.
+    """
+
+    def __init__(self, max_entries=None, ttl_seconds=None):
+        self.max_entries = max_entries or RESPONSE_CACHE_MAX_ENTRIES
+        self.ttl_seconds = RESPONSE_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0}
+
+    def _get_fresh(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if time.monotonic() - stored_at > self.ttl_seconds:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def get(self, key, loader):
+        """Returns the cached value for key, calling loader() once across concurrent misses. None is not cached."""
+        with self._lock:
+            entry = self._get_fresh(key)
+            if entry is not None:
+                self._stats["hits"] += 1
+                return entry[1]
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = {"done": threading.Event(), "value": None, "error": None}
+                self._in_flight[key] = flight
+                self._stats["misses"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            flight["done"].wait()
+            if flight["error"] is not None:
+                raise flight["error"]
+            return flight["value"]
+
+        try:
+            value = loader()
+            flight["value"] = value
+            if value is not None:
+                self.set(key, value)
+            return value
+        except Exception as e:
+            flight["error"] = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            flight["done"].set()
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["entries"] = len(self._entries)
+        lookups = snapshot["hits"] + snapshot["misses"] + snapshot["coalesced"]
+        # Coalesced lookups were served without touching the store, so they count as hits
+        snapshot["hit_rate"] = (snapshot["hits"] + snapshot["coalesced"]) / lookups if lookups else 0.0
+        return snapshot
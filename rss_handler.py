@@ -1,77 +1,251 @@
 import os
+import json
+import time
 import requests
 import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
 from dateutil.parser import parse as parse_date
 from datetime import datetime, timedelta, timezone
-from database import article_exists, add_article
+from database import add_new_articles, get_source_states, save_source_states
+from cancellation import Cancelled
+from metrics import span, count, bind_timings
 
-def parse_rss(xml_content):
-    """Parses the RSS XML content and returns a list of articles."""
-    articles = []
+# --- Feed Registry & Fetch Configuration ---
+RSS_FEEDS_FILE = os.environ.get("RSS_FEEDS_FILE", "feeds.json")
+RSS_MAX_WORKERS = int(os.environ.get("RSS_MAX_WORKERS", 16)) # Feeds downloaded at the same time
+RSS_FEED_TIMEOUT = float(os.environ.get("RSS_FEED_TIMEOUT", 10)) # Default per-feed timeout in seconds
+RSS_CHUNK_SIZE = 16 * 1024 # Bytes handed to the streaming parser at a time
+RSS_MAX_OLD_ITEMS = int(os.environ.get("RSS_MAX_OLD_ITEMS", 3)) # Consecutive out-of-window items before a feed stops parsing
+DEFAULT_POLL_INTERVAL_MINUTES = 5
+
+# One session shared by all fetch threads so connections to the same host are reused
+rss_session = requests.Session()
+rss_session.mount("http://", HTTPAdapter(pool_connections=RSS_MAX_WORKERS, pool_maxsize=RSS_MAX_WORKERS))
+rss_session.mount("https://", HTTPAdapter(pool_connections=RSS_MAX_WORKERS, pool_maxsize=RSS_MAX_WORKERS))
+
+def load_feed_registry():
+    """
+    Returns the list of feeds to follow: [{"name", "url", "poll_interval_minutes", "timeout"}].
+    Reads RSS_FEEDS_FILE and falls back to the single RSS_FEED URL if the file is absent.
+    """
+    if os.path.exists(RSS_FEEDS_FILE):
+        with open(RSS_FEEDS_FILE, 'r') as f:
+            feeds = json.load(f)
+    elif os.environ.get("RSS_FEED"):
+        feeds = [{"name": "The Guardian RSS", "url": os.environ["RSS_FEED"]}]
+    else:
+        return []
+
+    for feed in feeds:
+        feed.setdefault("poll_interval_minutes", DEFAULT_POLL_INTERVAL_MINUTES)
+        feed.setdefault("timeout", RSS_FEED_TIMEOUT)
+    return feeds
+
+def _item_text(item, tag):
+    child = item.find(tag)
+    if child is None or child.text is None:
+        return None
+    return child.text.strip()
+
+def _item_to_article(item, source_name):
+    """Builds an article dict from an <item>, tolerating missing fields. Returns None without a link."""
+    link = _item_text(item, 'link')
+    if not link:
+        return None
+    published_at = None
+    pub_date_str = _item_text(item, 'pubDate')
+    if pub_date_str:
+        try:
+            published_at = parse_date(pub_date_str)
+            # Ensure published_at is timezone-aware for comparison
+            if published_at.tzinfo is None:
+                published_at = published_at.replace(tzinfo=timezone.utc)
+        except (ValueError, OverflowError):
+            print(f"🟠 Unparseable pubDate '{pub_date_str}' in {source_name}.")
+    return {
+        'url': link,
+        'headline': _item_text(item, 'title') or link,
+        'summary': _item_text(item, 'description') or '',
+        'published_at': published_at,
+        'source_name': source_name
+    }
+
+def iter_rss_items(chunks, source_name='The Guardian RSS', min_timestamp=None):
+    """
+    Incrementally parses RSS bytes and yields articles as soon as each <item> closes.
+    Finished items are dropped from the tree, so memory stays flat for large feeds.
+    Items older than min_timestamp are skipped, and parsing stops (ending the download)
+    once RSS_MAX_OLD_ITEMS consecutive items fall outside the window.
+    """
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    channel = None
+    old_streak = 0
     try:
-        root = ET.fromstring(xml_content)
-        for item in root.findall('.//item'):
-            title = item.find('title').text
-            link = item.find('link').text
-            description = item.find('description').text
-            pub_date_str = item.find('pubDate').text
-            pub_date = parse_date(pub_date_str)
-
-            articles.append({
-                'url': link,
-                'headline': title,
-                'summary': description,
-                'published_at': pub_date,
-                'source_name': 'The Guardian RSS'
-            })
+        for chunk in chunks:
+            parser.feed(chunk)
+            for event, elem in parser.read_events():
+                if event == 'start':
+                    if elem.tag == 'channel':
+                        channel = elem
+                    continue
+                if elem.tag != 'item':
+                    continue
+
+                article = _item_to_article(elem, source_name)
+                elem.clear()
+                if channel is not None:
+                    channel.remove(elem)
+                if article is None:
+                    continue
+
+                if min_timestamp and article['published_at'] and article['published_at'] < min_timestamp:
+                    old_streak += 1
+                    if old_streak >= RSS_MAX_OLD_ITEMS:
+                        return
+                    continue
+                old_streak = 0
+                yield article
+        parser.close()
     except ET.ParseError as e:
-        print(f"🔴 ERROR: Failed to parse RSS XML: {e}")
-    return articles
-
-def fetch_and_store_articles(user_id, time_limit_hours=None):
-    """Fetches RSS feed, parses it, and stores new articles in the database."""
-    rss_url = os.environ.get("RSS_FEED")
-    if not rss_url:
-        print("🔴 ERROR: RSS_FEED URL not set in .env file.")
+        print(f"🔴 ERROR: Failed to parse RSS XML from {source_name}: {e}")
+
+def parse_rss(xml_content, source_name='The Guardian RSS'):
+    """Parses the RSS XML content and returns a list of articles."""
+    return list(iter_rss_items([xml_content], source_name))
+
+def feed_source_key(feed):
+    return f"rss:{feed['url']}"
+
+def is_source_due(state, poll_interval_minutes):
+    """A source is polled at most once per poll interval."""
+    if not state or not state.get('updated_at'):
+        return True
+    updated_at = state['updated_at']
+    if updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+    return datetime.now(timezone.utc) - updated_at >= timedelta(minutes=poll_interval_minutes)
+
+def _chunks_until_halted(chunks, should_halt):
+    for chunk in chunks:
+        if should_halt and should_halt():
+            raise Cancelled()
+        yield chunk
+
+def fetch_feed(feed, state, min_timestamp=None, should_halt=None):
+    """
+    Streams and parses one feed with a conditional GET, keeping only items newer than
+    both min_timestamp and the feed's high-water mark.
+    Returns (articles, new_state); articles is None when the feed is unchanged, failed or halted.
+    """
+    # Conditional GET: an unchanged feed answers 304 with no body to parse
+    headers = {}
+    if state.get('etag'):
+        headers['If-None-Match'] = state['etag']
+    if state.get('last_modified'):
+        headers['If-Modified-Since'] = state['last_modified']
+
+    last_published_at = state.get('last_published_at')
+    cutoff = max(filter(None, [min_timestamp, last_published_at]), default=None)
+
+    try:
+        print(f"Fetching articles from {feed['name']}...")
+        response = rss_session.get(feed['url'], headers=headers, timeout=feed['timeout'], stream=True)
+    except requests.exceptions.RequestException as e:
+        print(f"🔴 ERROR: Could not fetch RSS feed {feed['name']}: {e}")
+        return None, None
+
+    try:
+        if response.status_code == 304:
+            print(f"{feed['name']} unchanged since last fetch.")
+            return None, dict(state)
+        response.raise_for_status() # Raise an exception for bad status codes
+        # Parsing overlaps with the download and can stop it early
+        chunks = _chunks_until_halted(response.iter_content(RSS_CHUNK_SIZE), should_halt)
+        articles = list(iter_rss_items(chunks, feed['name'], cutoff))
+    except requests.exceptions.RequestException as e:
+        print(f"🔴 ERROR: Could not fetch RSS feed {feed['name']}: {e}")
+        return None, None
+    except Cancelled:
+        return None, None
+    finally:
+        response.close()
+
+    published_dates = [article['published_at'] for article in articles if article['published_at']]
+    if last_published_at:
+        published_dates.append(last_published_at)
+    new_state = {
+        'last_published_at': max(published_dates, default=None),
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+    }
+    return articles, new_state
+
+def fetch_and_store_articles(time_limit_hours=None, should_halt=None):
+    """
+    Fetches every due RSS feed in parallel, parses them, and stores new articles in the
+    shared content store. Returns the newly stored articles, newest first.
+    When should_halt() turns true the downloads are abandoned and nothing is stored.
+    """
+    feeds = load_feed_registry()
+    if not feeds:
+        print("🔴 ERROR: No RSS feeds configured. Set RSS_FEED or provide a feeds file.")
         return []
 
     min_timestamp = None
     if time_limit_hours:
         min_timestamp = datetime.now(timezone.utc) - timedelta(hours=int(time_limit_hours))
 
-    try:
-        print("Fetching articles from RSS feed...")
-        response = requests.get(rss_url, timeout=10)
-        response.raise_for_status() # Raise an exception for bad status codes
-    except requests.exceptions.RequestException as e:
-        print(f"🔴 ERROR: Could not fetch RSS feed: {e}")
+    states = get_source_states([feed_source_key(feed) for feed in feeds])
+    due_feeds = [feed for feed in feeds if is_source_due(states.get(feed_source_key(feed)), feed['poll_interval_minutes'])]
+    if not due_feeds:
+        print("No RSS feeds are due for polling.")
         return []
 
-    articles = parse_rss(response.content)
-    new_article_captions = []
-
-    for article in articles:
-        # Ensure published_at is timezone-aware for comparison
-        if article['published_at'].tzinfo is None:
-            article['published_at'] = article['published_at'].replace(tzinfo=timezone.utc)
-
-        if min_timestamp and article['published_at'] < min_timestamp:
-            print(f"Skipping old RSS article: {article['headline']}. Timestamp: {article['published_at']}")
-            continue
-
-        if not article_exists(article['url'], user_id):
-            print(f"Found new article: {article['headline']}")
-            add_article(
-                article['url'],
-                user_id,
-                article['headline'],
-                article['source_name'],
-                article['summary'],
-                article['published_at']
-            )
-            # Add the headline and summary to the list for Gemini processing
-            new_article_captions.append(f"- @{article['source_name']}: {article['headline']}\n{article['summary']}\n")
-        else:
-            print(f"Skipping article (already exists): {article['headline']}")
-
-    return "".join(new_article_captions)
\ No newline at end of file
+    # All feeds download at once, so the slowest feed bounds the total fetch time
+    executor = ThreadPoolExecutor(max_workers=min(RSS_MAX_WORKERS, len(due_feeds)), thread_name_prefix="rss-fetch")
+    def timed_fetch(feed):
+        with span("rss_feed", feed=feed['name']):
+            return fetch_feed(feed, states.get(feed_source_key(feed), {}), min_timestamp, should_halt)
+
+    timed_fetch = bind_timings(timed_fetch)
+    futures = {executor.submit(timed_fetch, feed): feed for feed in due_feeds}
+    deadline = time.monotonic() + max(feed['timeout'] for feed in due_feeds) * 2
+    done, not_done = set(), set(futures)
+    while not_done and time.monotonic() < deadline:
+        finished, not_done = wait(not_done, timeout=min(0.25, max(deadline - time.monotonic(), 0)))
+        done |= finished
+        if should_halt and should_halt():
+            executor.shutdown(wait=False, cancel_futures=True)
+            print("🛑 RSS fetch halted by user.")
+            return []
+    executor.shutdown(wait=False, cancel_futures=True)
+    for future in not_done:
+        print(f"🟠 Timed out fetching RSS feed {futures[future]['name']}.")
+
+    candidate_articles = {}
+    new_states = {}
+    for future in done:
+        feed = futures[future]
+        articles, new_state = future.result()
+        if new_state is not None:
+            new_states[feed_source_key(feed)] = new_state
+        for article in articles or []:
+            # The same story URL can appear in several feeds; keep the first one
+            candidate_articles.setdefault(article['url'], article)
+
+    # Dedup and store the merged batch in a single round trip
+    candidate_articles = list(candidate_articles.values())
+    with span("db_store", source="rss"):
+        new_articles = add_new_articles(candidate_articles)
+    count("items_fetched", len(candidate_articles), source="rss")
+    count("items_new", len(new_articles), source="rss")
+    skipped = len(candidate_articles) - len(new_articles)
+    if skipped:
+        print(f"Skipping {skipped} RSS articles that already exist in the database.")
+    save_source_states(new_states)
+
+    newest_first = sorted(new_articles, key=lambda article: article['published_at'] or datetime.min.replace(tzinfo=timezone.utc), reverse=True)
+    for article in newest_first:
+        print(f"Found new article: {article['headline']}")
+    return newest_first
@@ -0,0 +1,147 @@
+import os
+import time
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
+from metrics import span, count, bind_timings
+
+# --- Stylization Client Configuration ---
+STYLIZER_MAX_WORKERS = int(os.environ.get("STYLIZER_MAX_WORKERS", 5)) # Captions requested at the same time
+STYLIZER_TIMEOUT = float(os.environ.get("STYLIZER_TIMEOUT", 60)) # Per-item request timeout in seconds
+STYLIZER_RETRIES = int(os.environ.get("STYLIZER_RETRIES", 2)) # Extra attempts after a failed request
+STYLIZER_BACKOFF_SECONDS = float(os.environ.get("STYLIZER_BACKOFF_SECONDS", 1.0)) # Doubles after every retry
+STYLIZER_USE_BATCH_ENDPOINT = os.environ.get("STYLIZER_USE_BATCH_ENDPOINT", "0") == "1" # Send all summaries to /generate-captions at once
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+def _json_object(response):
+    """The response body as a dict, or None when it isn't a JSON object (e.g. a proxy's HTML error page)."""
+    try:
+        body = response.json()
+    except ValueError: # requests' JSONDecodeError
+        return None
+    return body if isinstance(body, dict) else None
+
+class StylizationClient:
+    """
+    Client for the inference server's /generate-caption endpoint. Requests go out
+    concurrently over one keep-alive session and results come back in input order.
+    Failures are returned as "Error: ..." captions rather than raised.
+    """
+
+    def __init__(self, base_url, max_workers=None, timeout=None, retries=None, backoff_seconds=None, use_batch_endpoint=None):
+        self.base_url = base_url.rstrip('/')
+        self.max_workers = max_workers or STYLIZER_MAX_WORKERS
+        self.timeout = timeout or STYLIZER_TIMEOUT
+        self.retries = STYLIZER_RETRIES if retries is None else retries
+        self.backoff_seconds = STYLIZER_BACKOFF_SECONDS if backoff_seconds is None else backoff_seconds
+        self.use_batch_endpoint = STYLIZER_USE_BATCH_ENDPOINT if use_batch_endpoint is None else use_batch_endpoint
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=self.max_workers))
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=self.max_workers))
+
+    def stylize(self, summary, should_halt=None):
+        """Returns the stylized caption for one summary, retrying transient failures with backoff."""
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff_seconds * 2 ** (attempt - 1))
+            if should_halt and should_halt():
+                return "Error: Stylization halted."
+            try:
+                with span("stylize_request"):
+                    response = self.session.post(
+                        f"{self.base_url}/generate-caption", json={"summary": summary}, timeout=self.timeout
+                    )
+            except requests.exceptions.RequestException as e:
+                print(f"🔴 ERROR connecting to Kaggle server (attempt {attempt + 1}): {e}")
+                caption = "Error: Could not connect to inference server."
+                continue
+
+            if response.status_code == 200:
+                body = _json_object(response)
+                if body is None:
+                    print(f"🔴 ERROR: Kaggle server returned a non-JSON caption response: {response.text[:200]!r}")
+                    count("stylize_errors", status="invalid_body")
+                    return 'Error: Invalid response from server.'
+                return body.get('stylized_caption', 'Error: Invalid response from server.')
+            caption = f"Error: Server returned status {response.status_code}"
+            count("stylize_errors", status=response.status_code)
+            if response.status_code not in RETRYABLE_STATUS_CODES:
+                break
+        return caption
+
+    def stream(self, summary):
+        """
+        Relays the inference server's /generate-caption-stream Server-Sent Events as raw bytes.
+        Connection failures are reported as a final SSE error event.
+        """
+        try:
+            with self.session.post(
+                f"{self.base_url}/generate-caption-stream", json={"summary": summary},
+                timeout=(10, self.timeout), stream=True
+            ) as response:
+                if response.status_code != 200:
+                    yield f'data: {{"error": "Server returned status {response.status_code}"}}\n\n'.encode()
+                    return
+                for chunk in response.iter_content(chunk_size=None):
+                    yield chunk
+        except requests.exceptions.RequestException as e:
+            print(f"🔴 ERROR streaming from Kaggle server: {e}")
+            yield b'data: {"error": "Could not connect to inference server."}\n\n'
+
+    def stylize_batch(self, summaries):
+        """Sends every summary in one /generate-captions call. Returns None if the server can't batch them."""
+        try:
+            with span("stylize_batch_request"):
+                response = self.session.post(
+                    f"{self.base_url}/generate-captions", json={"summaries": summaries}, timeout=self.timeout
+                )
+        except requests.exceptions.RequestException as e:
+            print(f"🟠 Batch stylization failed, falling back to per-item requests: {e}")
+            return None
+        if response.status_code != 200:
+            print(f"🟠 Batch stylization returned status {response.status_code}, falling back to per-item requests.")
+            return None
+        captions = (_json_object(response) or {}).get('stylized_captions')
+        if not isinstance(captions, list) or len(captions) != len(summaries):
+            return None
+        return captions
+
+    def stylize_many(self, summaries, should_halt=None):
+        """
+        Stylizes all summaries concurrently and returns the captions in the original order.
+        Once should_halt() is true the call returns right away; captions that weren't
+        ready are reported as halted and requests still in flight are abandoned.
+        """
+        if not summaries:
+            return []
+        if self.use_batch_endpoint:
+            captions = self.stylize_batch(summaries)
+            if captions is not None:
+                return captions
+        executor = ThreadPoolExecutor(max_workers=min(self.max_workers, len(summaries)), thread_name_prefix="stylize")
+        stylize = bind_timings(self.stylize)
+        futures = [executor.submit(stylize, summary, should_halt) for summary in summaries]
+        try:
+            pending = futures
+            while pending:
+                _, pending = wait(pending, timeout=0.25)
+                if pending and should_halt and should_halt():
+                    break
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        return [
+            future.result() if future.done() and not future.cancelled() else "Error: Stylization halted."
+            for future in futures
+        ]
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_stylization_client(base_url):
+    """Returns a shared client per inference URL so its connection pool is reused across requests."""
+    with _clients_lock:
+        if base_url not in _clients:
+            _clients[base_url] = StylizationClient(base_url)
+        return _clients[base_url]
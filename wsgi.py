@@ -0,0 +1,5 @@
+# Production entry point: gunicorn -c gunicorn.conf.py wsgi:app
+# The ingest worker isn't started here; run `python ingest_worker.py` alongside the web workers.
+from app_ig import app
+
+application = app